@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Batch audit of exchange rates consistency. It replaces per-read conflict
+checks of Currency.get_rate_object() when CURRENCY_CONFLICT_MODE = 'audit':
+run `./manage.py audit_rates --store` after rates are imported (and at least
+once a day) so reads use its result.
+
+"""
+from django.core.cache import cache
+
+from .models import (
+    ExchangeRate, DEFAULT_CURRENCY_CODE, RATES_AUDIT_CACHE_KEY,
+    get_rates_version,
+)
+
+
+class AuditResult(object):
+
+    """Result of audit_rates():
+
+    conflicts: list of (base_code, foreign_code, rate_date, indirect_date)
+        pairs where latest direct (or reverse) rate is older than indirect one
+    duplicates: list of (pk, reverse_pk, date) of rates that have reverse rate
+        for the same date (see ExchangeRate.clean())
+
+    """
+
+    def __init__(self, conflicts, duplicates, version=None):
+        self.conflicts = conflicts
+        self.duplicates = duplicates
+        self.version = version
+
+    @property
+    def conflicting_pairs(self):
+        """
+        frozenset of conflicting (base_code, foreign_code) pairs
+        """
+        return frozenset((conflict[0], conflict[1]) for conflict in self.conflicts)
+
+    def __nonzero__(self):
+        return bool(self.conflicts or self.duplicates)
+
+
+def audit_rates():
+    """
+    Scan all rates with single query and return AuditResult
+
+    """
+    version = get_rates_version()
+    rows = (
+        ExchangeRate.objects
+        .order_by('date')
+        .values_list(
+            'pk', 'base_currency__code', 'foreign_currency__code', 'date')
+    )
+    latest = {}
+    by_date = {}
+    duplicates = []
+    for pk, base, foreign, date in rows.iterator():
+        latest[(base, foreign)] = date
+        by_date[(base, foreign, date)] = pk
+        reverse_pk = by_date.get((foreign, base, date))
+        if reverse_pk is not None:
+            duplicates.append((pk, reverse_pk, date))
+
+    conflicts = []
+    pairs = set(latest)
+    pairs.update((foreign, base) for base, foreign in latest)
+    for base, foreign in sorted(pairs):
+        if DEFAULT_CURRENCY_CODE in (base, foreign):
+            continue
+        to_base = latest.get((DEFAULT_CURRENCY_CODE, base))
+        to_foreign = latest.get((DEFAULT_CURRENCY_CODE, foreign))
+        if to_base is None or to_foreign is None:
+            continue
+        # get_rate_object() prefers direct rate to reverse one
+        rate_date = latest.get((base, foreign)) or latest[(foreign, base)]
+        indirect_date = max(to_base, to_foreign)
+        if rate_date < indirect_date:
+            conflicts.append((base, foreign, rate_date, indirect_date))
+    return AuditResult(conflicts, duplicates, version)
+
+
+def store_audit_result(result, timeout=86400):
+    """
+    Save conflicting pairs from `result` for get_rate_object() in audit mode.
+    They are used until rates version changes
+
+    """
+    cache.set(
+        RATES_AUDIT_CACHE_KEY, (result.version, result.conflicting_pairs),
+        timeout)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from ...audit import audit_rates, store_audit_result
+
+
+class Command(BaseCommand):
+    help = (
+        'Report direct/reverse rates that are older than indirect ones and '
+        'reverse rates for the same date')
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--store', action='store_true', dest='store', default=False,
+            help='Store conflicts for CURRENCY_CONFLICT_MODE = "audit"'),
+    )
+
+    def handle(self, *args, **options):
+        result = audit_rates()
+        for base, foreign, rate_date, indirect_date in result.conflicts:
+            self.stdout.write(
+                'Conflict: %s to %s rate for %s is older than indirect rate '
+                'for %s' % (base, foreign, rate_date, indirect_date))
+        for pk, reverse_pk, date in result.duplicates:
+            self.stdout.write(
+                'Duplicate: rates with pk=%s and pk=%s are reverse rates for '
+                '%s' % (pk, reverse_pk, date))
+        if options['store']:
+            store_audit_result(result)
+        self.stdout.write('%s conflicts, %s duplicates' % (
+            len(result.conflicts), len(result.duplicates)))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...snapshot import dump_rate_snapshot
+
+
+class Command(BaseCommand):
+    args = '<path>'
+    help = 'Write rates snapshot that workers can memory-map at startup'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--history', action='store_true', dest='history', default=False,
+            help='Include all rates history to support rates for dates'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Snapshot path is required')
+        version = dump_rate_snapshot(args[0], history=options['history'])
+        self.stdout.write('Rates snapshot of version %s written to %s' % (
+            version, args[0]))
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-rate matrix of all currency pairs built with NumPy (optional
+dependency: pip install django-currency[matrix]).
+
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .models import Currency, DEFAULT_CURRENCY_CODE, get_rates_version
+from .rates import currency_code, get_latest_rates
+
+
+CROSS_RATES_CACHE_KEY = 'currency_cross_rates_{0}'
+
+
+class CrossRateMatrix(object):
+
+    """Rates between all pairs of currencies as NumPy array:
+    matrix[index[base], index[foreign]] converts base to foreign (NaN if
+    there is no rate, 1 on diagonal).
+
+    Rates are resolved like in Currency.get_rate_object(): stored direct
+    rate, then reverse rate, then indirect rate through default currency.
+    Indirect rates for all pairs are calculated in one vectorized step.
+
+    """
+
+    def __init__(self, codes, matrix, conflicts, version=None):
+        self.codes = list(codes)
+        self.index = dict((code, i) for i, code in enumerate(self.codes))
+        self.matrix = matrix
+        # boolean array: stored rate is older than indirect one
+        self.conflicts = conflicts
+        self.version = version
+
+    @classmethod
+    def build(cls, latest=None, codes=None, ignore_conflict=False):
+        """
+        Build matrix from `latest` rates lookup object (get_latest_rates() by
+        default) for `codes` (all currencies with rates by default). If
+        stored rate is older than indirect one then lookup raises ValueError
+        unless `ignore_conflict` is True (then indirect rate is used)
+
+        """
+        if numpy is None:
+            raise ImproperlyConfigured('CrossRateMatrix requires NumPy')
+        if latest is None:
+            latest = get_latest_rates()
+        stored = latest.rates
+        if codes is None:
+            codes = set([DEFAULT_CURRENCY_CODE])
+            for pair in stored:
+                codes.update(pair)
+            codes = sorted(codes)
+        else:
+            codes = [currency_code(code) for code in codes]
+        index = dict((code, i) for i, code in enumerate(codes))
+        default = index.get(DEFAULT_CURRENCY_CODE)
+        size = len(codes)
+
+        # rates and dates of default currency to each currency
+        to_rates = numpy.empty(size)
+        to_rates.fill(numpy.nan)
+        to_dates = numpy.zeros(size, dtype=numpy.int64)
+        for code, i in index.items():
+            entry = stored.get((DEFAULT_CURRENCY_CODE, code))
+            if entry:
+                to_rates[i] = float(entry[0])
+                to_dates[i] = entry[1].toordinal()
+
+        # indirect rates (see models.indirect_rate_value) and their dates
+        matrix = numpy.outer(to_rates, 1 / to_rates)
+        dates = numpy.maximum.outer(to_dates, to_dates)
+        if default is not None:
+            # there are no indirect rates from or to default currency
+            matrix[default, :] = numpy.nan
+            matrix[:, default] = numpy.nan
+        conflicts = numpy.zeros((size, size), dtype=bool)
+
+        # stored rates override indirect ones, direct rates win over reverse
+        for (base, foreign), (rate, date) in stored.items():
+            if base not in index or foreign not in index:
+                continue
+            i, j = index[base], index[foreign]
+            cells = [(i, j, float(rate))]
+            if (foreign, base) not in stored:
+                cells.append((j, i, 1 / float(rate)))
+            for row, column, value in cells:
+                if (default not in (row, column)
+                        and not numpy.isnan(matrix[row, column])
+                        and date.toordinal() < dates[row, column]):
+                    if ignore_conflict:
+                        continue
+                    conflicts[row, column] = True
+                matrix[row, column] = value
+        numpy.fill_diagonal(matrix, 1.0)
+        numpy.fill_diagonal(conflicts, False)
+        return cls(codes, matrix, conflicts, getattr(latest, 'version', None))
+
+    def get_rate(self, base_currency, foreign_currency, on=None):
+        if on is not None:
+            raise ValueError('CrossRateMatrix has no rates for specific dates')
+        try:
+            i = self.index[currency_code(base_currency)]
+            j = self.index[currency_code(foreign_currency)]
+        except KeyError:
+            raise Currency.DoesNotExist
+        if self.conflicts[i, j]:
+            raise ValueError(
+                'direct rate for %s-%s is older then indirect rate. '
+                'Please investigate' % (self.codes[i], self.codes[j]))
+        value = self.matrix[i, j]
+        if numpy.isnan(value):
+            raise Currency.DoesNotExist
+        return Decimal('%.15g' % value)
+
+    def convert_array(self, amounts, base_currency, currencies=None):
+        """
+        Convert array of `amounts` in `base_currency` to each of `currencies`
+        (all currencies of matrix by default). Return array of shape
+        (len(amounts), len(currencies)) with NaN for missing and conflicting
+        rates.
+
+        """
+        i = self.index[currency_code(base_currency)]
+        rates = numpy.where(self.conflicts[i], numpy.nan, self.matrix[i])
+        if currencies is not None:
+            rates = rates[[self.index[currency_code(code)] for code in currencies]]
+        return numpy.outer(numpy.asarray(amounts, dtype=float), rates)
+
+
+def get_cross_rate_matrix(timeout=86400):
+    """
+    Return CrossRateMatrix for current rates version. Matrix is cached as
+    single object
+    """
+    key = CROSS_RATES_CACHE_KEY.format(get_rates_version())
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = CrossRateMatrix.build()
+        cache.set(key, matrix, timeout)
+    return matrix
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from .rates import RateSnapshot, activate_snapshot, deactivate_snapshot
+
+
+class RateSnapshotMiddleware(object):
+
+    """
+    Share single RateSnapshot between all conversions of request. Snapshot is
+    available as `request.currency_rates` and is used by `currency` template
+    tags and filters.
+
+    """
+
+    def process_request(self, request):
+        request.currency_rates = RateSnapshot()
+        activate_snapshot(request.currency_rates)
+
+    def process_response(self, request, response):
+        deactivate_snapshot()
+        return response
+
+    def process_exception(self, request, exception):
+        deactivate_snapshot()
@@ -1,17 +1,51 @@
 # -*- coding: utf-8 -*-
 import datetime
+import time
 from decimal import Decimal, Context, localcontext
 
+from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 
+from . import profiling
+from .routers import mark_written
 from .utils import memoize_for_object, simple_cache
 
 
 RATES_CACHE_KEY = '{0}_{1}_rate'
 
+RATES_VERSION_CACHE_KEY = 'currency_rates_version'
+
+RATES_AUDIT_CACHE_KEY = 'currency_rates_audit'
+
+DEFAULT_CURRENCY_CODE = 'USD'
+
+# Storage of exchange rates. Changing these requires schema migration, e.g.
+# from project's own migrations module set with SOUTH_MIGRATION_MODULES
+RATE_MAX_DIGITS = getattr(settings, 'CURRENCY_RATE_MAX_DIGITS', 9)
+RATE_DECIMAL_PLACES = getattr(settings, 'CURRENCY_RATE_DECIMAL_PLACES', 5)
+
+# Money values are quantized to MONEY_DECIMAL_PLACES unless currency has its
+# own rounding rule in ROUNDING: {'JPY': (0, decimal.ROUND_HALF_UP)}. Rounding
+# mode None means rounding of decimal context (ROUND_HALF_EVEN)
+MONEY_DECIMAL_PLACES = getattr(
+    settings, 'CURRENCY_MONEY_DECIMAL_PLACES', RATE_DECIMAL_PLACES)
+ROUNDING = getattr(settings, 'CURRENCY_ROUNDING', {})
+
+# 'raise': get_rate_object() raises ValueError if direct or reverse rate is
+# older than indirect one. 'audit': conflicts are taken from last stored
+# result of audit (see currency.audit) while rates version is the same as
+# audited one and are never checked on read
+RAISE_CONFLICT_MODE = 'raise'
+AUDIT_CONFLICT_MODE = 'audit'
+CONFLICT_MODE = getattr(settings, 'CURRENCY_CONFLICT_MODE', RAISE_CONFLICT_MODE)
+
+# Number of significant digits kept by Money in exact mode
+EXACT_PRECISION = getattr(settings, 'CURRENCY_EXACT_PRECISION', 40)
+
 
 class Currency(models.Model):
 
@@ -55,13 +89,54 @@ class Currency(models.Model):
 
     @classmethod
     def get_default_currency(cls):
+        # plain get() is routed to read database unlike get_or_create()
+        try:
+            return cls.objects.get(code=DEFAULT_CURRENCY_CODE)
+        except cls.DoesNotExist:
+            pass
         currency, _ = cls.objects.get_or_create(
-            code='USD',
+            code=DEFAULT_CURRENCY_CODE,
             defaults={'short_name': '$', 'money_format': '%(short_name)s%(value)s'}
         )
         return currency
 
-    def get_rate_object(self, other_currency, ignore_conflict=False):
+    def latest_rate(self, other_currency, on=None):
+        """
+        Return latest stored ExchangeRate from current Currency to
+        `other_currency` (settled not later than `on` if it's given) or None
+
+        """
+        rates = self.rates.filter(foreign_currency=other_currency)
+        if on is not None:
+            rates = rates.filter(date__lte=on)
+        try:
+            return rates.latest()
+        except ExchangeRate.DoesNotExist:
+            return None
+
+    def indirect_rate(self, other_currency, on=None):
+        """
+        Return new (not saved) ExchangeRate from current Currency to
+        `other_currency` calculated from rates of default currency or None
+
+        """
+        default_currency = Currency.get_default_currency()
+        if default_currency.code == self.code:
+            return None
+        rate_to_self = default_currency.latest_rate(self, on)
+        if rate_to_self is None:
+            return None
+        rate_to_other = default_currency.latest_rate(other_currency, on)
+        if rate_to_other is None:
+            return None
+        return ExchangeRate(
+            base_currency=self,
+            foreign_currency=other_currency,
+            rate=indirect_rate_value(rate_to_self.rate, rate_to_other.rate),
+            date=max(rate_to_self.date, rate_to_other.date),
+        )
+
+    def get_rate_object(self, other_currency, ignore_conflict=False, on=None):
         """
         Return ExchangeRate instance that can be used to convert current
         Currency to `other_currency`.
@@ -72,81 +147,84 @@ class Currency(models.Model):
         then ValueError is raise. This can be overriden with
         ignore_conflict=True, then newer rate is returned
 
+        With CURRENCY_CONFLICT_MODE = 'audit' setting conflicts are not checked
+        here: first found of direct, reverse and indirect rates is returned
+        and indirect rate is used for pairs with conflicts found by last
+        audit_rates run of current rates version (see currency.audit). Audit
+        covers latest rates only, so it's not used for dates `on`.
+
+        If date `on` is given then only rates settled not later than `on` are
+        used (last known rate for that date). Indirect rates for dates are not
+        stored: they would conflict with later rates of the pair.
+
         Return value: (exchangerate_instance, is_reverse_boolean)
 
         """
-        # direct exchange rate
+        if profiling.profilers:
+            profiling.record('get_rate_object', self.code, other_currency.code)
         with localcontext(Context(prec=ExchangeRate.PRECISION + 10)):
-            try:
-                direct_rate = (
-                    self.rates.filter(foreign_currency=other_currency).latest()
-                )
-            except ExchangeRate.DoesNotExist:
-                direct_rate = None
-
-            try:
-                reverse_rate = (
-                    other_currency.rates.filter(foreign_currency=self).latest()
-                )
-            except ExchangeRate.DoesNotExist:
-                reverse_rate = None
-
-            # indirect exchange rate
-            indirect_rate = False
-            try:
-                default_currency = Currency.get_default_currency()
-                if default_currency.code != self.code:
-                    rate_to_self = (
-                        default_currency.rates
-                                        .filter(foreign_currency=self)
-                                        .latest()
-                    )
-                    rate_to_other = (
-                        default_currency.rates
-                                        .filter(foreign_currency=other_currency)
-                                        .latest()
-                    )
-                    new_rate = rate_to_self.rate / rate_to_other.rate
-                    new_date = max(rate_to_self.date, rate_to_other.date)
-                    indirect_rate = ExchangeRate(
-                        base_currency=self,
-                        foreign_currency=other_currency,
-                        rate=new_rate,
-                        date=new_date,
-                    )
-            except ExchangeRate.DoesNotExist:
-                pass
+            if CONFLICT_MODE == AUDIT_CONFLICT_MODE:
+                rate, is_reverse = self.get_audited_rate_object(
+                    other_currency, on)
+            else:
+                rate, is_reverse = self.get_checked_rate_object(
+                    other_currency, ignore_conflict, on)
+            if rate is None:
+                raise Currency.DoesNotExist
+            if rate.pk is None and on is None:  # indirect rate
+                rate.save(derived=True)
+            return (rate, is_reverse)
 
-            is_reverse = False
-            rate = None
-            if not indirect_rate:
+    def get_checked_rate_object(self, other_currency, ignore_conflict, on):
+        direct_rate = self.latest_rate(other_currency, on)
+        reverse_rate = other_currency.latest_rate(self, on)
+        indirect_rate = self.indirect_rate(other_currency, on)
+
+        is_reverse = False
+        rate = None
+        if not indirect_rate:
+            if direct_rate:
+                rate = direct_rate
+            elif reverse_rate:
+                rate = reverse_rate
+                is_reverse = True
+        else:
+            if not (direct_rate or reverse_rate):
+                rate = indirect_rate
+            else:  # we have both indirect and (reverse or direct) rates
                 if direct_rate:
                     rate = direct_rate
-                elif reverse_rate:
+                else:
                     rate = reverse_rate
                     is_reverse = True
-            else:
-                if not (direct_rate or reverse_rate):
-                    rate = indirect_rate
-                else:  # we have both indirect and (reverse or direct) rates
-                    if direct_rate:
-                        rate = direct_rate
+
+                if rate.date < indirect_rate.date:
+                    if not ignore_conflict:
+                        raise ValueError(
+                            'direct rate `%s` is older then indirect rate `%s`. '
+                            'Please investigate' % (rate, indirect_rate))
                     else:
-                        rate = reverse_rate
-                        is_reverse = True
-
-                    if rate.date < indirect_rate.date:
-                        if not ignore_conflict:
-                            raise ValueError(
-                                'direct rate `%s` is older then indirect rate `%s`. '
-                                'Please investigate' % (direct_rate, indirect_rate))
-                        else:
-                            rate = indirect_rate
-            if rate is None:
-                raise Currency.DoesNotExist
-            if rate == indirect_rate:
-                rate.save()
-            return (rate, is_reverse)
+                        rate = indirect_rate
+                        is_reverse = False
+        return (rate, is_reverse)
+
+    def get_audited_rate_object(self, other_currency, on):
+        direct_rate = self.latest_rate(other_currency, on)
+        reverse_rate = None
+        if direct_rate is None:
+            reverse_rate = other_currency.latest_rate(self, on)
+        if on is None and (self.code, other_currency.code) in get_audited_conflicts():
+            # indirect rate was newer than direct or reverse one. Once it is
+            # stored it's found as direct rate of the same date
+            rate = direct_rate or reverse_rate
+            indirect_rate = self.indirect_rate(other_currency, on)
+            if indirect_rate and (rate is None or rate.date < indirect_rate.date):
+                return (indirect_rate, False)
+        if direct_rate:
+            return (direct_rate, False)
+        if reverse_rate:
+            return (reverse_rate, True)
+        return (self.indirect_rate(other_currency, on), False)
 
     def get_rate(self, *args, **kwargs):
         """
@@ -161,20 +239,30 @@ class Currency(models.Model):
             return rate
 
 
+def indirect_rate_value(rate_to_self, rate_to_other):
+    """
+    Return rate between two currencies calculated from their rates against
+    default currency. Should be called inside of precise decimal context.
+
+    """
+    return rate_to_self / rate_to_other
+
+
 def validate_positive(value):
     if value <= 0:
         raise ValidationError('%s is not positive' % value)
 
 
 class ExchangeRate(models.Model):
-    PRECISION = 5
+    PRECISION = RATE_DECIMAL_PLACES
 
     base_currency = models.ForeignKey(Currency, related_name='rates')
 
     foreign_currency = models.ForeignKey(Currency, related_name='reverse_rates')
 
     rate = models.DecimalField(
-        _(u'Exchange rate'), max_digits=9, decimal_places=PRECISION,
+        _(u'Exchange rate'), max_digits=RATE_MAX_DIGITS,
+        decimal_places=PRECISION,
         default='1',
         validators=[validate_positive])
 
@@ -193,11 +281,22 @@ class ExchangeRate(models.Model):
         return "%s to %s for %s: %s" % (self.base_currency, self.foreign_currency, self.date, self.rate)
 
     def save(self, *args, **kwargs):
+        # derived=True is used for indirect rates stored on read: they don't
+        # change resolved rates, so rates version (and stored audit) is kept
+        derived = kwargs.pop('derived', False)
         super(ExchangeRate, self).save(*args, **kwargs)
+        self.rates_changed(bump_version=not derived)
+
+    def rates_changed(self, bump_version=True):
+        """
+        Drop cached rates of the pair and change rates version
+        """
         key = RATES_CACHE_KEY.format(self.base_currency.code, self.foreign_currency.code)
         cache.delete(key)
         key = RATES_CACHE_KEY.format(self.foreign_currency.code, self.base_currency.code)
         cache.delete(key)
+        if bump_version:
+            bump_rates_version()
 
     def clean(self):
         # only called from admin and modelforms. If you create "bad" model with
@@ -223,6 +322,61 @@ class ExchangeRate(models.Model):
         return
 
 
+def currency_model_written(sender, **kwargs):
+    mark_written()
+
+
+def exchange_rate_deleted(sender, instance, **kwargs):
+    # also called for rates deleted with queryset or by cascade
+    instance.rates_changed()
+
+
+post_save.connect(currency_model_written, sender=Currency)
+post_delete.connect(currency_model_written, sender=Currency)
+post_save.connect(currency_model_written, sender=ExchangeRate)
+post_delete.connect(currency_model_written, sender=ExchangeRate)
+post_delete.connect(exchange_rate_deleted, sender=ExchangeRate)
+
+
+def bump_rates_version():
+    """
+    Mark all rates as changed. Version is time of change in milliseconds.
+    It's stored without expiration so that snapshots, API ETags and stored
+    audit stay valid while rates are not changed
+    """
+    version = int(time.time() * 1000)
+    previous = cache.get(RATES_VERSION_CACHE_KEY)
+    if previous is not None and previous >= version:
+        version = previous + 1
+    cache.set(RATES_VERSION_CACHE_KEY, version, None)
+    return version
+
+
+def get_rates_version():
+    """
+    Return version of rates that changes each time rates are saved
+    """
+    version = cache.get(RATES_VERSION_CACHE_KEY)
+    if version is None:
+        version = bump_rates_version()
+    return version
+
+
+def get_audited_conflicts():
+    """
+    Return set of (base_code, foreign_code) pairs with conflicting rates
+    stored by last audit (see currency.audit.store_audit_result()). Result
+    of audit is ignored once rates are changed after it
+    """
+    audit = cache.get(RATES_AUDIT_CACHE_KEY)
+    if not audit:
+        return frozenset()
+    version, conflicts = audit
+    if not conflicts or version != get_rates_version():
+        return frozenset()
+    return conflicts
+
+
 def get_currency(currency):
     """
     If currency is of type Currency then just return it. If it's string then
@@ -240,14 +394,21 @@ def get_currency(currency):
 
 
 @simple_cache(RATES_CACHE_KEY, 86400)
+def _cached_get_rate(base_currency, foreign_currency):
+    if profiling.profilers:
+        profiling.record('cache_miss', base_currency, foreign_currency)
+    return get_currency(base_currency).get_rate(get_currency(foreign_currency))
+
+
 def cached_get_rate(base_currency, foreign_currency):
     """Return exchange rate between two currencies. Results are cached for 1 day.
 
     :type base_currency: string or unicode
     :type foreign_currency: string or unicode
     """
-
-    return get_currency(base_currency).get_rate(get_currency(foreign_currency))
+    if profiling.profilers:
+        profiling.record('cached_get_rate', base_currency, foreign_currency)
+    return _cached_get_rate(base_currency, foreign_currency)
 
 
 class Money(object):
@@ -276,26 +437,51 @@ class Money(object):
     >>> my_money.convert_to('EUR').convert_to('USD') - my_money
     <Money: -3USD>
     >>> # Ooops!
+    >>> exact_money = Money(153123, 'USD', exact=True)
+    >>> exact_money.convert_to('EUR').convert_to('USD').rounded() - my_money
+    <Money: 0.00000USD>
+
+    With exact=True value is not quantized after each operation: conversions
+    and arithmetic keep EXACT_PRECISION significant digits and exact mode is
+    inherited by results. Call rounded() once at the final boundary to get
+    regular Money quantized according to currency rounding rules.
 
     """
-    def __init__(self, value, currency='USD', max_digits=15):
+    def __init__(self, value, currency='USD', max_digits=15, exact=False):
         self.precision = max_digits
-        places = ExchangeRate.PRECISION
+        self.exact = exact
         if not (isinstance(currency, basestring) and len(currency) == 3):
             raise TypeError("currency argument should be a string with lenght 3")
         self.currency = currency.upper()
-        self.context = Context(prec=self.precision)
+        if profiling.profilers:
+            profiling.record('money', self.currency)
+        places, self.rounding = ROUNDING.get(
+            self.currency, (MONEY_DECIMAL_PLACES, None))
+        if exact:
+            self.context = Context(prec=max(self.precision, EXACT_PRECISION))
+        else:
+            self.context = Context(prec=self.precision)
         with localcontext(self.context):
             if isinstance(value, Decimal):
                 self.value = value
             else:
                 self.value = Decimal(str(value))
             self.quantizator = Decimal(10) ** (-places)
-            self.value = self.quantize(self.value)
+            if not exact:
+                self.value = self.quantize(self.value)
         return
 
     def quantize(self, value):
-        return value.quantize(self.quantizator)
+        return value.quantize(self.quantizator, rounding=self.rounding)
+
+    def rounded(self):
+        """Return new regular (not exact) Money with value quantized according
+        to rounding rules of currency
+
+        """
+        with localcontext(self.context):
+            return Money(self.quantize(self.value), self.currency,
+                         max_digits=self.precision)
 
     def __unicode__(self):
         return "%s%s" % (self.value, self.currency)
@@ -308,6 +494,10 @@ class Money(object):
 
     @staticmethod
     def same_currencies(one, other):
+        if not isinstance(other, Money):
+            raise TypeError(
+                "Can't combine %s with %r of type %s" % (
+                    one, other, type(other).__name__))
         if one.currency != other.currency:
             raise ValueError(
                 'Currencies of %s and %s differ. Please convert them '
@@ -316,20 +506,35 @@ class Money(object):
         return True
 
     @memoize_for_object
-    def get_rate(self, other_currency):
-        """Just calls get_rate but memoizes result so even cache is not hit
+    def get_rate(self, other_currency, on=None):
+        """Just calls get_rate but memoizes result so even cache is not hit.
+        Rates for specific date `on` are not cached
 
         """
-        return cached_get_rate(self.currency, other_currency)
+        if on is None:
+            return cached_get_rate(self.currency, other_currency)
+        return get_currency(self.currency).get_rate(
+            get_currency(other_currency), on=on)
 
-    def convert_to(self, other_currency):
+    def convert_to(self, other_currency, on=None, rates=None):
         """Return current Money converted to other_currency as new instance of
         Money
 
+        `on` is optional date of conversion: last rate known for that date is
+        used. `rates` is optional lookup object (e.g. RateCalendar) that is
+        used instead of database and cache.
+
         """
+        if profiling.profilers:
+            profiling.record('convert_to', self.currency, other_currency)
         with localcontext(self.context):
-            rate = self.get_rate(other_currency)
-            result = Money(self.value * rate, other_currency)
+            if rates is not None:
+                rate = rates.get_rate(self.currency, other_currency, on=on)
+            elif on is not None:
+                rate = self.get_rate(other_currency, on=on)
+            else:
+                rate = self.get_rate(other_currency)
+            result = Money(self.value * rate, other_currency, exact=self.exact)
             return result
 
     def new(self, value):
@@ -337,17 +542,27 @@ class Money(object):
 
         """
         with localcontext(self.context):
-            return Money(value, self.currency)
+            return Money(value, self.currency, exact=self.exact)
+
+    def common(self, other):
+        """Return one of current and `other` Money which context and exact
+        mode are used for result of operation on both: exact one if any
+
+        """
+        self.same_currencies(self, other)
+        if other.exact and not self.exact:
+            return other
+        return self
 
     def __add__(self, other):
-        with localcontext(self.context):
-            self.same_currencies(self, other)
-            return self.new(self.value + other.value)
+        common = self.common(other)
+        with localcontext(common.context):
+            return common.new(self.value + other.value)
 
     def __sub__(self, other):
-        with localcontext(self.context):
-            self.same_currencies(self, other)
-            return self.new(self.value - other.value)
+        common = self.common(other)
+        with localcontext(common.context):
+            return common.new(self.value - other.value)
 
     def __mul__(self, other):
         with localcontext(self.context):
@@ -363,3 +578,134 @@ class Money(object):
         with localcontext(self.context):
             other = Decimal(str(other))
             return self.new(divmod(self.value, other))
+
+    def __radd__(self, other):
+        # allows sum() of Money instances that starts with 0
+        if not isinstance(other, Money) and other == 0:
+            return self
+        return self.__add__(other)
+
+    def __neg__(self):
+        return self.new(-self.value)
+
+    def __abs__(self):
+        return self.new(abs(self.value))
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.currency == other.currency and self.value == other.value
+
+    def __ne__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.currency != other.currency or self.value != other.value
+
+    def __lt__(self, other):
+        self.same_currencies(self, other)
+        return self.value < other.value
+
+    def __le__(self, other):
+        self.same_currencies(self, other)
+        return self.value <= other.value
+
+    def __gt__(self, other):
+        self.same_currencies(self, other)
+        return self.value > other.value
+
+    def __ge__(self, other):
+        self.same_currencies(self, other)
+        return self.value >= other.value
+
+    def __hash__(self):
+        return hash((self.currency, self.value))
+
+    @classmethod
+    def sum(cls, moneys, currency=None):
+        """Return sum of Money instances of same currency. Values are
+        accumulated in single decimal context and quantized once. `currency`
+        is required for empty `moneys`
+
+        """
+        total = Decimal(0)
+        exact = False
+        with localcontext(Context(prec=EXACT_PRECISION)):
+            for money in moneys:
+                if currency is None:
+                    currency = money.currency
+                elif money.currency != currency:
+                    raise ValueError(
+                        'Currencies of %s and %s differ. Please convert them '
+                        'to same currencies' % (money, currency)
+                    )
+                total += money.value
+                exact = exact or money.exact
+        if currency is None:
+            raise ValueError("Can't sum empty sequence without currency")
+        return cls(total, currency, exact=exact)
+
+
+class MoneyBag(object):
+
+    """Accumulator of Money in several currencies. Totals are tracked per
+    currency and converted only once when single total is needed:
+
+    >>> bag = MoneyBag([Money(10, 'USD'), Money(5, 'EUR')])
+    >>> bag += Money(3, 'EUR')
+    >>> bag['EUR']
+    <Money: 8.00000EUR>
+    >>> bag.convert_to('USD')
+    <Money: 20.40000USD>
+
+    """
+
+    def __init__(self, moneys=()):
+        self.totals = {}
+        self.exact = False
+        self.update(moneys)
+
+    def update(self, moneys):
+        totals = self.totals
+        with localcontext(Context(prec=EXACT_PRECISION)):
+            for money in moneys:
+                currency = money.currency
+                totals[currency] = totals.get(currency, 0) + money.value
+                self.exact = self.exact or money.exact
+
+    def add(self, money):
+        self.update((money,))
+
+    def __iadd__(self, other):
+        if isinstance(other, MoneyBag):
+            self.update(iter(other))
+        else:
+            self.add(other)
+        return self
+
+    def __getitem__(self, currency):
+        return Money(self.totals[currency], currency, exact=self.exact)
+
+    def __iter__(self):
+        for currency in sorted(self.totals):
+            yield self[currency]
+
+    def __len__(self):
+        return len(self.totals)
+
+    def __repr__(self):
+        return '<MoneyBag: %s>' % ', '.join(str(money) for money in self)
+
+    def convert_to(self, currency, on=None, rates=None):
+        """Return total of all currencies converted to `currency`. Each
+        currency is converted once and result is rounded once (unless bag
+        contains exact Money)
+
+        """
+        total = Money.sum(
+            (Money(value, code, exact=True).convert_to(currency, on=on, rates=rates)
+             if code != currency else Money(value, code, exact=True)
+             for code, value in self.totals.items()),
+            currency=currency)
+        if self.exact:
+            return total
+        return total.rounded()
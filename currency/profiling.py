@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiler that attributes conversion cost to call sites:
+
+    with ConversionProfiler() as profiler:
+        render_price_list()
+    print(profiler.report())
+
+Events are counted per caller location (first frame outside of currency
+package and Django, so conversions in templates are attributed to code that
+renders them) and currency pair:
+
+* money: Money instances created
+* convert_to: Money.convert_to() calls
+* cached_get_rate: cached_get_rate() calls
+* cache_miss: cached_get_rate() calls that were not found in cache
+* get_rate_object: Currency.get_rate_object() calls (database resolution)
+
+"""
+import logging
+import os
+import sys
+import threading
+from collections import defaultdict
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+EVENTS = ('money', 'convert_to', 'cached_get_rate', 'cache_miss', 'get_rate_object')
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# frames of these directories are skipped when caller is searched
+INTERNAL_DIRS = (
+    PACKAGE_DIR,
+    os.path.dirname(os.path.abspath(django.__file__)),
+)
+
+# tests of currency package are reported as callers
+TESTS_DIR = os.path.join(PACKAGE_DIR, 'tests')
+
+logger = logging.getLogger('currency.profiling')
+
+# active profilers. Instrumented code checks it before calling record()
+profilers = []
+
+_package_files = {}
+
+
+def in_package(filename):
+    try:
+        return _package_files[filename]
+    except KeyError:
+        path = os.path.abspath(filename)
+        result = (
+            any(path.startswith(directory + os.sep) for directory in INTERNAL_DIRS)
+            and not path.startswith(TESTS_DIR + os.sep))
+        _package_files[filename] = result
+        return result
+
+
+def caller_location():
+    frame = sys._getframe(1)
+    while frame is not None and in_package(frame.f_code.co_filename):
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    return '%s:%s' % (frame.f_code.co_filename, frame.f_lineno)
+
+
+def pair_name(base, foreign=None):
+    if foreign is None:
+        return u'%s' % base
+    return u'%s-%s' % (base, foreign)
+
+
+def record(event, base, foreign=None):
+    """
+    Count `event` for currency pair in all active profilers
+    """
+    location = caller_location()
+    pair = pair_name(base, foreign)
+    thread = threading.current_thread().ident
+    for profiler in list(profilers):
+        if profiler.thread is None or profiler.thread == thread:
+            profiler.counts[(location, pair)][event] += 1
+
+
+class ConversionProfiler(object):
+
+    """Collect conversion events while active. Only events of thread that
+    started profiler are counted unless all_threads is True.
+
+    """
+
+    def __init__(self, all_threads=False):
+        self.all_threads = all_threads
+        self.thread = None
+        # {(location, pair): {event: count}}
+        self.counts = defaultdict(lambda: dict.fromkeys(EVENTS, 0))
+
+    def start(self):
+        if not self.all_threads:
+            self.thread = threading.current_thread().ident
+        profilers.append(self)
+
+    def stop(self):
+        if self in profilers:
+            profilers.remove(self)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """
+        Return list of (location, pair, counts) sorted by total number of
+        events
+        """
+        return sorted(
+            ((location, pair, counts)
+             for (location, pair), counts in self.counts.items()),
+            key=lambda row: (-sum(row[2].values()), row[0], row[1]))
+
+    def report(self, limit=None):
+        stats = self.stats()[:limit]
+        header = EVENTS + ('pair', 'location')
+        lines = ['  '.join(header)]
+        for location, pair, counts in stats:
+            lines.append('  '.join(
+                [str(counts[event]).rjust(len(event)) for event in EVENTS] +
+                [pair.ljust(len('pair')), location]))
+        return '\n'.join(lines)
+
+
+class ConversionProfilerMiddleware(object):
+
+    """
+    Log ConversionProfiler report of each request to `currency.profiling`
+    logger. Enabled with CURRENCY_PROFILING = True setting.
+
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'CURRENCY_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.limit = getattr(settings, 'CURRENCY_PROFILING_LIMIT', 20)
+
+    def process_request(self, request):
+        request.currency_profiler = ConversionProfiler()
+        request.currency_profiler.start()
+
+    def process_response(self, request, response):
+        profiler = getattr(request, 'currency_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            if profiler.counts:
+                logger.info(
+                    'Conversions of %s:\n%s', request.path,
+                    profiler.report(self.limit))
+        return response
+
+    def process_exception(self, request, exception):
+        profiler = getattr(request, 'currency_profiler', None)
+        if profiler is not None:
+            profiler.stop()
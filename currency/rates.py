@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+import datetime
+import threading
+from collections import defaultdict
+from decimal import Decimal, Context, localcontext
+
+from django.conf import settings
+from django.db import connections
+
+from .models import (
+    Currency, ExchangeRate, DEFAULT_CURRENCY_CODE, cached_get_rate,
+    get_rates_version, indirect_rate_value,
+)
+
+
+_active = threading.local()
+
+_latest_rates = None
+
+# path to file written by snapshot.dump_rate_snapshot() that is used by
+# get_latest_rates() while its version is current
+SNAPSHOT_PATH = getattr(settings, 'CURRENCY_RATE_SNAPSHOT', None)
+
+
+def currency_code(currency):
+    """
+    Return ISO code for `currency` that can be Currency instance or string
+
+    """
+    if isinstance(currency, Currency):
+        return currency.code
+    return currency.upper()
+
+
+def resolve_rate(direct, reverse, to_base, to_foreign, ignore_conflict=False):
+    """
+    Choose rate with the same rules as Currency.get_rate_object() from
+    (rate, date) tuples (or None) of direct and reverse rate and rates of
+    default currency to base and foreign currencies. Should be called inside
+    of precise decimal context.
+
+    Return Decimal, None if there is no rate or ValueError instance if rates
+    conflict.
+
+    """
+    indirect = None
+    if to_base and to_foreign:
+        indirect = (
+            indirect_rate_value(to_base[0], to_foreign[0]),
+            max(to_base[1], to_foreign[1]),
+        )
+    if direct:
+        rate, date = direct
+    elif reverse:
+        rate, date = Decimal('1') / reverse[0], reverse[1]
+    elif indirect:
+        return indirect[0]
+    else:
+        return None
+    if indirect and date < indirect[1]:
+        if not ignore_conflict:
+            return ValueError(
+                'direct rate for %s is older then indirect rate for %s. '
+                'Please investigate' % (date, indirect[1]))
+        return indirect[0]
+    return rate
+
+
+def date_column_sql(connection):
+    qn = connection.ops.quote_name
+    return '%s.%s' % (
+        qn(ExchangeRate._meta.db_table),
+        qn(ExchangeRate._meta.get_field('date').column))
+
+
+def latest_rate_sql(connection, on=False):
+    """
+    SQL condition that selects only latest rate of each pair (settled not
+    later than date parameter if `on` is True)
+    """
+    qn = connection.ops.quote_name
+    field = ExchangeRate._meta.get_field
+    sql = (
+        '{rates}.{date} = ('
+        'SELECT MAX(previous.{date}) FROM {rates} previous '
+        'WHERE previous.{base} = {rates}.{base} '
+        'AND previous.{foreign} = {rates}.{foreign}'
+    )
+    if on:
+        sql += ' AND previous.{date} <= %s'
+    return (sql + ')').format(
+        rates=qn(ExchangeRate._meta.db_table),
+        date=qn(field('date').column),
+        base=qn(field('base_currency').column),
+        foreign=qn(field('foreign_currency').column),
+    )
+
+
+class RateCalendar(object):
+
+    """Dense grid of exchange rates for set of currency pairs and date range.
+
+    All rates needed for grid are fetched with single query and then grid is
+    filled in one pass. Days without rate get last known rate (FORWARD_FILL)
+    or rate linearly interpolated between known neighbours (LINEAR). Rates
+    are resolved the same way as in Currency.get_rate_object(): direct rate,
+    then reverse rate, then indirect rate through default currency.
+
+    >>> calendar = RateCalendar([('USD', 'EUR'), ('UAH', 'EUR')],
+    ...                         datetime.date(2013, 1, 1),
+    ...                         datetime.date(2013, 12, 31))
+    >>> calendar.get_rate('USD', 'EUR', on=datetime.date(2013, 6, 15))
+    Decimal('0.76923')
+    >>> Money(10, 'USD').convert_to(
+    ...     'EUR', on=datetime.date(2013, 6, 15), rates=calendar)
+    <Money: 7.69230EUR>
+
+    """
+
+    FORWARD_FILL = 'ffill'
+    LINEAR = 'linear'
+
+    def __init__(self, pairs, start, end, method=FORWARD_FILL,
+                 ignore_conflict=False):
+        if method not in (self.FORWARD_FILL, self.LINEAR):
+            raise ValueError('Unknown fill method `%s`' % method)
+        if start > end:
+            raise ValueError('Calendar start %s is after end %s' % (start, end))
+        self.start = start
+        self.end = end
+        self.method = method
+        self.ignore_conflict = ignore_conflict
+        self.pairs = [
+            (currency_code(base), currency_code(foreign))
+            for base, foreign in pairs
+        ]
+        self.days = [
+            start + datetime.timedelta(days=n)
+            for n in range((end - start).days + 1)
+        ]
+        self._grid = {}
+        self.build()
+
+    def fetch_rates(self):
+        """
+        Return dict of stored rates {(base_code, foreign_code): [(date, rate)]}
+        ordered by date for all currencies of calendar. Older history than
+        last rate before calendar start is not fetched
+
+        """
+        codes = set([DEFAULT_CURRENCY_CODE])
+        for pair in self.pairs:
+            codes.update(pair)
+        rates = ExchangeRate.objects.filter(
+            base_currency__code__in=codes,
+            foreign_currency__code__in=codes,
+            date__lte=self.end)
+        connection = connections[rates.db]
+        start = connection.ops.value_to_db_date(self.start)
+        rows = (
+            rates
+            .extra(where=[self.lower_bound_sql(connection)], params=[start, start])
+            .order_by('date')
+            .values_list(
+                'base_currency__code', 'foreign_currency__code', 'date', 'rate')
+        )
+        series = defaultdict(list)
+        for base, foreign, date, rate in rows:
+            series[(base, foreign)].append((date, rate))
+        return series
+
+    @staticmethod
+    def lower_bound_sql(connection):
+        """
+        SQL condition that limits rates to calendar range plus the last rate
+        of each pair settled before it that is needed to fill first days
+        """
+        return '%s >= %%s OR %s' % (
+            date_column_sql(connection), latest_rate_sql(connection, on=True))
+
+    def fill(self, points):
+        """
+        Return list of (rate, settlement_date) for each day of calendar built
+        from `points` ordered by date. None is used for days before first
+        known rate.
+
+        """
+        result = []
+        count = len(points)
+        position = 0  # index of first point after current day
+        for day in self.days:
+            while position < count and points[position][0] <= day:
+                position += 1
+            if not position:
+                result.append(None)
+                continue
+            date, rate = points[position - 1]
+            if self.method == self.LINEAR and date != day and position < count:
+                next_date, next_rate = points[position]
+                rate += (next_rate - rate) * (
+                    Decimal((day - date).days) / (next_date - date).days)
+            result.append((rate, date))
+        return result
+
+    def build(self):
+        series = self.fetch_rates()
+        filled = {}
+
+        def dense(pair):
+            if pair not in filled:
+                filled[pair] = self.fill(series.get(pair, []))
+            return filled[pair]
+
+        with localcontext(Context(prec=ExchangeRate.PRECISION + 10)):
+            for base, foreign in self.pairs:
+                direct = dense((base, foreign))
+                reverse = dense((foreign, base))
+                if base != DEFAULT_CURRENCY_CODE:
+                    to_base = dense((DEFAULT_CURRENCY_CODE, base))
+                    to_foreign = dense((DEFAULT_CURRENCY_CODE, foreign))
+                else:
+                    to_base = to_foreign = [None] * len(self.days)
+                self._grid[(base, foreign)] = [
+                    self.resolve(*rates)
+                    for rates in zip(direct, reverse, to_base, to_foreign)
+                ]
+
+    def resolve(self, direct, reverse, to_base, to_foreign):
+        return resolve_rate(
+            direct, reverse, to_base, to_foreign, self.ignore_conflict)
+
+    def get_rate(self, base_currency, foreign_currency, on=None):
+        """
+        Return rate to convert `base_currency` to `foreign_currency` on date
+        `on` (last day of calendar by default)
+
+        """
+        base = currency_code(base_currency)
+        foreign = currency_code(foreign_currency)
+        if on is None:
+            on = self.end
+        if not self.start <= on <= self.end:
+            raise ValueError(
+                '%s is out of calendar range %s - %s' % (on, self.start, self.end))
+        if base == foreign:
+            return Decimal('1')
+        index = (on - self.start).days
+        try:
+            rate = self._grid[(base, foreign)][index]
+        except KeyError:
+            try:
+                rate = self._grid[(foreign, base)][index]
+            except KeyError:
+                raise KeyError('Pair %s-%s is not in calendar' % (base, foreign))
+            if isinstance(rate, Decimal):
+                with localcontext(Context(prec=ExchangeRate.PRECISION + 10)):
+                    rate = Decimal('1') / rate
+        if rate is None:
+            raise Currency.DoesNotExist
+        if isinstance(rate, ValueError):
+            raise rate
+        return rate
+
+    def convert_many(self, items, currency):
+        """
+        Convert iterable of (money, date) pairs to `currency`. Return list of
+        Money instances
+
+        """
+        return [
+            money.convert_to(currency, on=on, rates=self)
+            for money, on in items
+        ]
+
+
+class RateSnapshot(object):
+
+    """Memo of rates and currencies shared by all conversions and formatting
+    of single request (see RateSnapshotMiddleware): each pair is resolved
+    through cached_get_rate() and each currency is fetched only once.
+
+    """
+
+    def __init__(self):
+        self.rates = {}
+        self.currencies = {}
+
+    def get_rate(self, base_currency, foreign_currency, on=None):
+        key = (currency_code(base_currency), currency_code(foreign_currency), on)
+        try:
+            return self.rates[key]
+        except KeyError:
+            pass
+        base, foreign = key[:2]
+        if base == foreign:
+            rate = Decimal('1')
+        elif on is None:
+            rate = cached_get_rate(base, foreign)
+        else:
+            rate = self.get_currency(base).get_rate(
+                self.get_currency(foreign), on=on)
+        self.rates[key] = rate
+        return rate
+
+    def get_currency(self, currency):
+        code = currency_code(currency)
+        try:
+            return self.currencies[code]
+        except KeyError:
+            self.currencies[code] = Currency.objects.get(code=code)
+            return self.currencies[code]
+
+    def convert(self, money, currency, on=None):
+        return money.convert_to(currency_code(currency), on=on, rates=self)
+
+    def format(self, money):
+        return self.get_currency(money.currency).format(money.value)
+
+
+def activate_snapshot(snapshot):
+    """
+    Set RateSnapshot that is used by template tags in current thread
+
+    """
+    _active.snapshot = snapshot
+
+
+def deactivate_snapshot():
+    if hasattr(_active, 'snapshot'):
+        del _active.snapshot
+
+
+def get_active_snapshot():
+    return getattr(_active, 'snapshot', None)
+
+
+class LatestRates(object):
+
+    """Latest stored rate of every currency pair loaded with single query.
+    Rates are resolved without database the same way as in
+    Currency.get_rate_object() but indirect rates are not stored.
+
+    """
+
+    def __init__(self, rates, version=None, ignore_conflict=False):
+        # {(base_code, foreign_code): (rate, date)}
+        self.rates = rates
+        self.version = version
+        self.ignore_conflict = ignore_conflict
+
+    @classmethod
+    def load(cls, version=None, **kwargs):
+        rates = ExchangeRate.objects.all()
+        rows = (
+            rates
+            .extra(where=[latest_rate_sql(connections[rates.db])])
+            .order_by()
+            .values_list(
+                'base_currency__code', 'foreign_currency__code', 'date', 'rate')
+            .iterator()
+        )
+        rates = {}
+        for base, foreign, date, rate in rows:
+            rates[(base, foreign)] = (rate, date)
+        return cls(rates, version, **kwargs)
+
+    @property
+    def last_modified(self):
+        """
+        datetime of version (UTC) or None
+        """
+        if self.version is None:
+            return None
+        return datetime.datetime.utcfromtimestamp(self.version / 1000.)
+
+    def get_rate(self, base_currency, foreign_currency, on=None):
+        if on is not None:
+            raise ValueError('LatestRates has no rates for specific dates')
+        base = currency_code(base_currency)
+        foreign = currency_code(foreign_currency)
+        if base == foreign:
+            return Decimal('1')
+        get = self.rates.get
+        to_base = to_foreign = None
+        if base != DEFAULT_CURRENCY_CODE:
+            to_base = get((DEFAULT_CURRENCY_CODE, base))
+            to_foreign = get((DEFAULT_CURRENCY_CODE, foreign))
+        with localcontext(Context(prec=ExchangeRate.PRECISION + 10)):
+            rate = resolve_rate(
+                get((base, foreign)), get((foreign, base)), to_base, to_foreign,
+                self.ignore_conflict)
+        if rate is None:
+            raise Currency.DoesNotExist
+        if isinstance(rate, ValueError):
+            raise rate
+        return rate
+
+
+def get_latest_rates():
+    """
+    Return process-wide LatestRates that is reloaded when rates version
+    changes. Snapshot file from CURRENCY_RATE_SNAPSHOT setting is
+    memory-mapped instead of querying database if it has current version
+
+    """
+    global _latest_rates
+    version = get_rates_version()
+    if _latest_rates is None or _latest_rates.version != version:
+        latest = None
+        if SNAPSHOT_PATH:
+            from .snapshot import load_rate_snapshot
+            try:
+                latest = load_rate_snapshot(SNAPSHOT_PATH)
+            except (IOError, ValueError):
+                pass
+        if latest is None or latest.version != version:
+            latest = LatestRates.load(version)
+        _latest_rates = latest
+    return _latest_rates
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Database router that sends reads of currency models to replica:
+
+    DATABASE_ROUTERS = ['currency.routers.CurrencyRouter']
+    CURRENCY_READ_DATABASE = 'replica'
+
+Writes go to CURRENCY_WRITE_DATABASE ('default'). After each write reads of
+all processes are sent to write database for CURRENCY_READ_YOUR_WRITES
+seconds so fresh rates are not lost because of replication lag (e.g. cached
+for a day by other worker after cache of the pair is dropped). Time of last
+write is shared through cache.
+
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+APP_LABEL = 'currency'
+
+READ_DATABASE = getattr(settings, 'CURRENCY_READ_DATABASE', DEFAULT_DB_ALIAS)
+WRITE_DATABASE = getattr(settings, 'CURRENCY_WRITE_DATABASE', DEFAULT_DB_ALIAS)
+READ_YOUR_WRITES = getattr(settings, 'CURRENCY_READ_YOUR_WRITES', 5)
+
+LAST_WRITE_CACHE_KEY = 'currency_last_write'
+
+# time of last write of current process
+_last_write = 0
+
+
+def mark_written():
+    """
+    Start read-your-writes window. Called on each save or delete of currency
+    models, call it after bulk operations (e.g. bulk_create() of rates)
+
+    """
+    global _last_write
+    _last_write = time.time()
+    if READ_YOUR_WRITES and READ_DATABASE != WRITE_DATABASE:
+        cache.set(
+            LAST_WRITE_CACHE_KEY, _last_write,
+            int(math.ceil(READ_YOUR_WRITES)))
+
+
+def read_your_writes():
+    """
+    Return True while read-your-writes window started by write of any process
+    is open
+    """
+    now = time.time()
+    if now - _last_write < READ_YOUR_WRITES:
+        return True
+    if not READ_YOUR_WRITES:
+        return False
+    last_write = cache.get(LAST_WRITE_CACHE_KEY)
+    return last_write is not None and now - last_write < READ_YOUR_WRITES
+
+
+class CurrencyRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        if READ_DATABASE != WRITE_DATABASE and read_your_writes():
+            return WRITE_DATABASE
+        return READ_DATABASE
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return WRITE_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == obj2._meta.app_label == APP_LABEL:
+            return True
+        return None
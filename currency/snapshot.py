@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary snapshot of rates that can be memory-mapped by workers at
+startup instead of rebuilding rate state with ORM queries.
+
+File layout (little-endian):
+
+* header: magic, format version, decimal places of rates, number of
+  currencies N, number of history records H, rates version
+* N currency codes, 3 ascii bytes each
+* N x N matrix of latest rates: fixed-point int64 values (0 if there is no
+  rate), then N x N int32 date ordinals
+* only if H > 0: N x N (start, count) uint32 index of history records
+  followed by H history records (date ordinal, rate) ordered by pair and
+  date
+
+"""
+import datetime
+import mmap
+import os
+import struct
+from decimal import Decimal, Context, localcontext
+
+from .models import (
+    Currency, ExchangeRate, DEFAULT_CURRENCY_CODE, get_rates_version,
+)
+from .rates import LatestRates, currency_code, resolve_rate
+
+
+MAGIC = b'DCRS'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<4sHHIIq')
+RATE = struct.Struct('<q')
+DATE = struct.Struct('<i')
+INDEX = struct.Struct('<II')
+HISTORY = struct.Struct('<iq')
+
+
+def to_fixed(rate, scale):
+    value = int(rate * scale)
+    if not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError('Rate %s does not fit into snapshot' % rate)
+    return value
+
+
+def dump_rate_snapshot(path, history=False):
+    """
+    Write latest rates (and all rates history if `history` is True) to file
+    at `path`. File is replaced atomically so workers never see partial
+    snapshot.
+
+    """
+    # version is taken before rates so that changes made during dump
+    # outdate snapshot
+    latest = LatestRates.load(get_rates_version())
+    codes = set()
+    for pair in latest.rates:
+        codes.update(pair)
+    codes = sorted(codes)
+    index = dict((code, i) for i, code in enumerate(codes))
+    size = len(codes)
+    scale = 10 ** ExchangeRate.PRECISION
+
+    rates = [0] * (size * size)
+    dates = [0] * (size * size)
+    for (base, foreign), (rate, date) in latest.rates.items():
+        position = index[base] * size + index[foreign]
+        rates[position] = to_fixed(rate, scale)
+        dates[position] = date.toordinal()
+
+    records = []
+    if history:
+        rows = (
+            ExchangeRate.objects
+            .order_by('base_currency__code', 'foreign_currency__code', 'date')
+            .values_list(
+                'base_currency__code', 'foreign_currency__code', 'date', 'rate')
+        )
+        records = [
+            (index[base] * size + index[foreign],
+             date.toordinal(), to_fixed(rate, scale))
+            for base, foreign, date, rate in rows.iterator()
+        ]
+
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, ExchangeRate.PRECISION, size, len(records),
+            latest.version or 0))
+        snapshot.write(b''.join(code.encode('ascii') for code in codes))
+        snapshot.write(struct.pack('<%sq' % len(rates), *rates))
+        snapshot.write(struct.pack('<%si' % len(dates), *dates))
+        if records:
+            counts = [0] * (size * size)
+            for record in records:
+                counts[record[0]] += 1
+            start = 0
+            for count in counts:
+                snapshot.write(INDEX.pack(start, count))
+                start += count
+            for pair, ordinal, rate in records:
+                snapshot.write(HISTORY.pack(ordinal, rate))
+    os.rename(tmp_path, path)
+    return latest.version
+
+
+def load_rate_snapshot(path, **kwargs):
+    """
+    Memory-map snapshot written by dump_rate_snapshot(). Mapping is read-only
+    and is shared by all processes that load the same file.
+
+    """
+    with open(path, 'rb') as snapshot:
+        data = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    return MappedRates(data, **kwargs)
+
+
+class MappedRates(object):
+
+    """Rates lookup object backed by memory-mapped snapshot. Provides the
+    same get_rate() as LatestRates plus rates for dates when snapshot
+    contains history.
+
+    """
+
+    def __init__(self, data, ignore_conflict=False):
+        if len(data) < HEADER.size:
+            raise ValueError('Snapshot is truncated')
+        magic, format_version, places, size, history, version = (
+            HEADER.unpack_from(data))
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError('Unknown snapshot format')
+        self.data = data
+        self.scale = Decimal(10) ** places
+        self.size = size
+        self.history = history
+        self.version = version or None
+        self.ignore_conflict = ignore_conflict
+        codes_offset = HEADER.size
+        codes = data[codes_offset:codes_offset + 3 * size]
+        self.codes = [codes[i:i + 3] for i in range(0, 3 * size, 3)]
+        self.index = dict((code, i) for i, code in enumerate(self.codes))
+        self.rates_offset = codes_offset + 3 * size
+        self.dates_offset = self.rates_offset + RATE.size * size * size
+        self.history_index_offset = self.dates_offset + DATE.size * size * size
+        self.history_offset = (
+            self.history_index_offset + INDEX.size * size * size)
+        expected = self.history_index_offset
+        if history:
+            expected = self.history_offset + HISTORY.size * history
+        if len(data) != expected:
+            raise ValueError('Snapshot is truncated')
+        self._rates = None
+
+    # same as in LatestRates: datetime of version
+    last_modified = LatestRates.last_modified
+
+    def entry(self, base, foreign, on=None):
+        """
+        Return (rate, date) for stored pair of currency codes or None
+        """
+        try:
+            position = self.index[base] * self.size + self.index[foreign]
+        except KeyError:
+            return None
+        if on is not None:
+            return self.history_entry(position, on)
+        value, = RATE.unpack_from(
+            self.data, self.rates_offset + RATE.size * position)
+        if not value:
+            return None
+        ordinal, = DATE.unpack_from(
+            self.data, self.dates_offset + DATE.size * position)
+        return (
+            Decimal(value) / self.scale,
+            datetime.date.fromordinal(ordinal),
+        )
+
+    def history_entry(self, position, on):
+        if not self.history:
+            raise ValueError('Snapshot has no rates history')
+        start, count = INDEX.unpack_from(
+            self.data, self.history_index_offset + INDEX.size * position)
+        ordinal = on.toordinal()
+        offset = self.history_offset + HISTORY.size * start
+        # binary search of first record after `on`
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            date, value = HISTORY.unpack_from(
+                self.data, offset + HISTORY.size * middle)
+            if date <= ordinal:
+                low = middle + 1
+            else:
+                high = middle
+        if not low:
+            return None
+        date, value = HISTORY.unpack_from(
+            self.data, offset + HISTORY.size * (low - 1))
+        return Decimal(value) / self.scale, datetime.date.fromordinal(date)
+
+    @property
+    def rates(self):
+        """
+        Latest rates as dict {(base_code, foreign_code): (rate, date)}
+        """
+        if self._rates is None:
+            rates = {}
+            for base in self.codes:
+                for foreign in self.codes:
+                    entry = self.entry(base, foreign)
+                    if entry:
+                        rates[(base, foreign)] = entry
+            self._rates = rates
+        return self._rates
+
+    def get_rate(self, base_currency, foreign_currency, on=None):
+        base = currency_code(base_currency)
+        foreign = currency_code(foreign_currency)
+        if base == foreign:
+            return Decimal('1')
+        to_base = to_foreign = None
+        with localcontext(Context(prec=ExchangeRate.PRECISION + 10)):
+            if base != DEFAULT_CURRENCY_CODE:
+                to_base = self.entry(DEFAULT_CURRENCY_CODE, base, on)
+                to_foreign = self.entry(DEFAULT_CURRENCY_CODE, foreign, on)
+            rate = resolve_rate(
+                self.entry(base, foreign, on), self.entry(foreign, base, on),
+                to_base, to_foreign, self.ignore_conflict)
+        if rate is None:
+            raise Currency.DoesNotExist
+        if isinstance(rate, ValueError):
+            raise rate
+        return rate
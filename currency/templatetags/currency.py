@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from django import template
+
+from ..models import Currency, Money
+from ..rates import RateSnapshot, get_active_snapshot
+
+
+register = template.Library()
+
+RENDER_CONTEXT_KEY = 'currency_rates'
+
+
+def get_snapshot(context=None):
+    """
+    Return RateSnapshot activated by RateSnapshotMiddleware. Without
+    middleware snapshot is shared during single template rendering when
+    `context` is available.
+
+    """
+    snapshot = get_active_snapshot()
+    if snapshot is None and context is not None:
+        snapshot = context.render_context.get(RENDER_CONTEXT_KEY)
+        if snapshot is None:
+            snapshot = RateSnapshot()
+            context.render_context[RENDER_CONTEXT_KEY] = snapshot
+    return snapshot
+
+
+def convert_money(money, currency, snapshot=None):
+    if snapshot is None:
+        return money.convert_to(currency)
+    return snapshot.convert(money, currency)
+
+
+def format_money(money, snapshot=None):
+    if snapshot is None:
+        return Currency.objects.get(code=money.currency).format(money.value)
+    return snapshot.format(money)
+
+
+@register.filter
+def convert(money, currency):
+    """
+    Convert Money to `currency`: {{ price|convert:"EUR" }}
+
+    """
+    if not isinstance(money, Money):
+        return ''
+    try:
+        return convert_money(money, currency, get_snapshot())
+    except (Currency.DoesNotExist, ValueError, TypeError):
+        return ''
+
+
+@register.filter
+def money_format(money):
+    """
+    Format Money according to its currency: {{ price|money_format }}
+
+    """
+    if not isinstance(money, Money):
+        return money
+    try:
+        return format_money(money, get_snapshot())
+    except Currency.DoesNotExist:
+        return money
+
+
+@register.simple_tag(takes_context=True, name='money')
+def money_tag(context, money, currency=None):
+    """
+    Format Money optionally converted to `currency`:
+    {% money price "EUR" %}
+
+    """
+    if not isinstance(money, Money):
+        return ''
+    snapshot = get_snapshot(context)
+    try:
+        if currency is not None:
+            money = convert_money(money, currency, snapshot)
+        return format_money(money, snapshot)
+    except (Currency.DoesNotExist, ValueError, TypeError):
+        return ''
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures shared by test modules
+"""
+
+# system:
+import datetime
+
+# django:
+from django.core.cache import cache
+
+# local
+from ..models import Currency, ExchangeRate
+
+
+def day(number):
+    return datetime.date(2013, 6, number)
+
+
+class CurrenciesTestMixin(object):
+
+    """USD (default), EUR, UAH and RUB currencies and empty cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.usd = Currency.get_default_currency()
+        self.eur = Currency.objects.create(code='EUR', short_name=u'€')
+        self.uah = Currency.objects.create(code='UAH', short_name='hrn')
+        self.rub = Currency.objects.create(code='RUB', short_name='rub')
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_rate(self, base_currency, foreign_currency, rate, date=None):
+        kwargs = {}
+        if date is not None:
+            kwargs['date'] = date
+        return ExchangeRate.objects.create(
+            base_currency=base_currency, foreign_currency=foreign_currency,
+            rate=rate, **kwargs)
+
+
+class RatesTestMixin(CurrenciesTestMixin):
+
+    """Direct, reverse and indirect (UAH-RUB) rates of today"""
+
+    def setUp(self):
+        super(RatesTestMixin, self).setUp()
+        self.create_rate(self.usd, self.uah, '0.125')
+        self.create_rate(self.usd, self.rub, '0.03125')
+        self.create_rate(self.eur, self.usd, '1.3')
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# system:
+from decimal import Decimal
+from StringIO import StringIO
+
+# django:
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+# thirdparty
+from mock import patch
+
+# local
+from .. import models
+from ..audit import audit_rates, store_audit_result
+from ..models import Currency, cached_get_rate
+from .base import CurrenciesTestMixin, day
+
+
+class TestRatesAudit(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestRatesAudit, self).setUp()
+        self.create_rate(self.usd, self.uah, '8', day(2))
+        self.create_rate(self.usd, self.rub, '32', day(2))
+        self.create_rate(self.uah, self.rub, '5', day(1))
+        self.rate = self.create_rate(self.usd, self.eur, '0.8', day(3))
+        self.reverse_rate = self.create_rate(self.eur, self.usd, '1.3', day(3))
+
+    def test_audit(self):
+        with self.assertNumQueries(1):
+            result = audit_rates()
+        self.assertEqual(result.conflicts, [
+            ('RUB', 'UAH', day(1), day(2)),
+            ('UAH', 'RUB', day(1), day(2)),
+        ])
+        self.assertEqual(
+            result.duplicates, [(self.reverse_rate.pk, self.rate.pk, day(3))])
+        self.assertTrue(result)
+
+        # stored indirect rate fixes conflict
+        self.uah.get_rate(self.rub, ignore_conflict=True)
+        self.rub.get_rate(self.uah, ignore_conflict=True)
+        self.reverse_rate.delete()
+        self.assertFalse(audit_rates())
+
+    def test_audit_mode(self):
+        with self.assertRaises(ValueError):
+            self.uah.get_rate(self.rub)
+        with patch.object(models, 'CONFLICT_MODE', models.AUDIT_CONFLICT_MODE):
+            # conflicts are not checked on read
+            self.assertEqual(self.uah.get_rate(self.rub), Decimal('5'))
+            self.assertEqual(self.rub.get_rate(self.uah), Decimal('0.2'))
+            store_audit_result(audit_rates())
+            self.assertEqual(self.uah.get_rate(self.rub), Decimal('0.25'))
+            self.assertEqual(self.rub.get_rate(self.uah), Decimal('4'))
+
+    def test_audit_mode_repeated_reads(self):
+        with patch.object(models, 'CONFLICT_MODE', models.AUDIT_CONFLICT_MODE):
+            result = audit_rates()
+            for i in range(2):
+                # result is ignored after cache.clear() drops audited version
+                store_audit_result(result)
+                self.assertEqual(self.uah.get_rate(self.rub), Decimal('0.25'))
+                # stored indirect rate is used as direct one
+                self.assertEqual(self.uah.get_rate(self.rub), Decimal('0.25'))
+                self.assertEqual(cached_get_rate('UAH', 'RUB'), Decimal('0.25'))
+                cache.clear()
+        self.assertEqual(
+            self.uah.rates.filter(foreign_currency=self.rub).count(), 2)
+
+    def test_audit_mode_several_conflicts(self):
+        gbp = Currency.objects.create(code='GBP', short_name=u'£')
+        self.create_rate(self.usd, gbp, '128', day(2))
+        self.create_rate(self.uah, gbp, '1', day(1))
+        with patch.object(models, 'CONFLICT_MODE', models.AUDIT_CONFLICT_MODE):
+            store_audit_result(audit_rates())
+            version = models.get_rates_version()
+            self.assertEqual(self.uah.get_rate(self.rub), Decimal('0.25'))
+            # stored indirect rate doesn't outdate audit of other pairs
+            self.assertEqual(models.get_rates_version(), version)
+            self.assertEqual(self.uah.get_rate(gbp), Decimal('0.0625'))
+            self.assertEqual(cached_get_rate('RUB', 'UAH'), Decimal('4'))
+            self.assertEqual(cached_get_rate('GBP', 'UAH'), Decimal('16'))
+
+    def test_outdated_audit(self):
+        with patch.object(models, 'CONFLICT_MODE', models.AUDIT_CONFLICT_MODE):
+            store_audit_result(audit_rates())
+            self.assertIn(('UAH', 'RUB'), models.get_audited_conflicts())
+            # audit is not used for dates
+            self.assertEqual(self.uah.get_rate(self.rub, on=day(2)), Decimal('5'))
+            # newer direct rate is imported after audit
+            self.create_rate(self.uah, self.rub, '6', day(3))
+            self.assertEqual(models.get_audited_conflicts(), frozenset())
+            self.assertEqual(self.uah.get_rate(self.rub), Decimal('6'))
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('audit_rates', store=True, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('Conflict: UAH to RUB rate for 2013-06-01', output)
+        self.assertIn('2 conflicts, 1 duplicates', output)
+        self.assertEqual(
+            models.get_audited_conflicts(),
+            frozenset([('UAH', 'RUB'), ('RUB', 'UAH')]))
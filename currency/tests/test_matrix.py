@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# system:
+from decimal import Decimal
+from unittest import skipIf
+
+# django:
+from django.test import TestCase
+
+# local
+from ..matrix import CrossRateMatrix, get_cross_rate_matrix, numpy
+from ..models import Currency
+from ..rates import LatestRates
+from .base import CurrenciesTestMixin, day
+
+
+@skipIf(numpy is None, 'NumPy is not installed')
+class TestCrossRateMatrix(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestCrossRateMatrix, self).setUp()
+        self.gbp = Currency.objects.create(code='GBP', short_name=u'£')
+        self.create_rate(self.usd, self.uah, '8', day(2))
+        self.create_rate(self.usd, self.rub, '32', day(2))
+        self.create_rate(self.eur, self.usd, '1.25', day(2))
+        self.create_rate(self.usd, self.eur, '0.76923', day(3))
+        self.create_rate(self.gbp, self.eur, '1.2', day(4))
+        # older than indirect rate
+        self.create_rate(self.uah, self.rub, '5', day(1))
+
+    def assertSameRates(self, matrix, latest):
+        for base in matrix.codes:
+            for foreign in matrix.codes:
+                if base == foreign:
+                    continue
+                try:
+                    expected = latest.get_rate(base, foreign)
+                except (Currency.DoesNotExist, ValueError) as e:
+                    with self.assertRaises(type(e)):
+                        matrix.get_rate(base, foreign)
+                else:
+                    self.assertAlmostEqual(
+                        matrix.get_rate(base, foreign), expected, places=10)
+
+    def test_same_as_latest_rates(self):
+        latest = LatestRates.load()
+        matrix = CrossRateMatrix.build(latest)
+        self.assertEqual(matrix.codes, ['EUR', 'GBP', 'RUB', 'UAH', 'USD'])
+        self.assertSameRates(matrix, latest)
+        self.assertEqual(matrix.get_rate('UAH', 'UAH'), Decimal('1'))
+        self.assertEqual(matrix.get_rate('EUR', 'USD'), Decimal('1.25'))
+        self.assertEqual(matrix.get_rate('EUR', 'UAH'), Decimal('0.09615375'))
+        with self.assertRaises(ValueError):
+            matrix.get_rate('RUB', 'UAH')
+        with self.assertRaises(Currency.DoesNotExist):
+            matrix.get_rate('GBP', 'JPY')
+
+        latest = LatestRates.load(ignore_conflict=True)
+        matrix = CrossRateMatrix.build(latest, ignore_conflict=True)
+        self.assertSameRates(matrix, latest)
+
+    def test_convert_array(self):
+        matrix = CrossRateMatrix.build(codes=['USD', 'UAH', 'RUB', 'EUR'])
+        self.assertEqual(matrix.codes, ['USD', 'UAH', 'RUB', 'EUR'])
+        result = matrix.convert_array([1, 10], 'UAH', ['USD', 'RUB', 'UAH'])
+        self.assertEqual(result.shape, (2, 3))
+        self.assertAlmostEqual(result[1, 0], 1.25)
+        self.assertTrue(numpy.isnan(result[1, 1]))
+        self.assertEqual(result[1, 2], 10)
+        self.assertAlmostEqual(
+            matrix.convert_array([2], 'USD')[0, 3], 1.53846)
+
+    def test_cache(self):
+        matrix = get_cross_rate_matrix()
+        with self.assertNumQueries(0):
+            cached = get_cross_rate_matrix()
+        self.assertEqual(cached.codes, matrix.codes)
+        self.create_rate(self.gbp, self.rub, '50')
+        self.assertEqual(get_cross_rate_matrix().get_rate('GBP', 'RUB'), Decimal('50'))
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 # system:
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 import datetime
+import operator
 
 # django:
 from django.core.cache import cache
@@ -12,7 +13,9 @@ from django.test import TestCase
 from mock import patch
 
 # local
-from ..models import Currency, ExchangeRate, Money
+from .. import models
+from ..models import Currency, ExchangeRate, Money, MoneyBag
+from .base import CurrenciesTestMixin
 
 
 class TestMoneyExchanging(TestCase):
@@ -122,3 +125,110 @@ class TestMoneyExchanging(TestCase):
         self.assertEqual((usd_money.new('2') / Decimal('3')).value, Decimal('0.66667'))
         self.assertEqual((usd_money.new('2.55387') + usd_money.new('1.33')).value, Decimal('3.88387'))
         self.assertEqual((usd_money.new('2.55387') - usd_money.new('1.33')).value, Decimal('1.22387'))
+
+
+class TestExactMoney(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestExactMoney, self).setUp()
+        self.create_rate(self.usd, self.eur, '0.76923')
+
+    def test_chained_conversion(self):
+        usd_money = Money('1531.37', 'USD')
+        self.assertEqual(
+            usd_money.convert_to('EUR').convert_to('USD').value,
+            Decimal('1531.37001'))
+
+        exact_money = Money('1531.37', 'USD', exact=True)
+        eur_money = exact_money.convert_to('EUR')
+        self.assertTrue(eur_money.exact)
+        self.assertEqual(eur_money.value, Decimal('1177.9757451'))
+        self.assertEqual(eur_money.rounded().value, Decimal('1177.97575'))
+        back = eur_money.convert_to('USD').rounded()
+        self.assertFalse(back.exact)
+        self.assertEqual(back.value, usd_money.value)
+
+    def test_operations_keep_precision(self):
+        money = Money(2, 'USD', exact=True) / 3
+        self.assertEqual(len(money.value.as_tuple().digits), models.EXACT_PRECISION)
+        self.assertEqual((money * 3).rounded().value, Decimal('2'))
+        self.assertEqual((Money(2, 'USD') / 3 * 3).value, Decimal('2.00001'))
+
+    def test_mixed_operations(self):
+        exact = Money('0.123456789', 'USD', exact=True)
+        for result in (Money(1, 'USD') + exact, exact + Money(1, 'USD')):
+            self.assertTrue(result.exact)
+            self.assertEqual(result.value, Decimal('1.123456789'))
+        result = Money(1, 'USD') - exact
+        self.assertTrue(result.exact)
+        self.assertEqual(result.value, Decimal('0.876543211'))
+
+    def test_currency_rounding(self):
+        with patch.dict(models.ROUNDING, {'JPY': (0, ROUND_HALF_UP)}):
+            self.assertEqual(Money('10.5', 'JPY').value, Decimal('11'))
+            self.assertEqual(Money('10.49', 'JPY').value, Decimal('10'))
+            exact_yens = Money('10.5', 'JPY', exact=True)
+            self.assertEqual(exact_yens.value, Decimal('10.5'))
+            self.assertEqual(exact_yens.rounded().value, Decimal('11'))
+            self.assertEqual(Money('2.000005', 'USD').value, Decimal('2.00000'))
+
+
+class TestMoneyAggregation(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestMoneyAggregation, self).setUp()
+        self.create_rate(self.eur, self.usd, '1.3')
+
+    def test_comparison(self):
+        self.assertEqual(Money('1.5', 'USD'), Money(Decimal('1.50'), 'USD'))
+        self.assertNotEqual(Money('1.5', 'USD'), Money('1.5', 'EUR'))
+        self.assertNotEqual(Money('1.5', 'USD'), Decimal('1.5'))
+        self.assertTrue(Money(1, 'USD') < Money(2, 'USD') <= Money(2, 'USD'))
+        self.assertTrue(Money(3, 'USD') > Money(2, 'USD') >= Money(2, 'USD'))
+        with self.assertRaises(ValueError):
+            Money(1, 'USD') < Money(2, 'EUR')
+        self.assertEqual(
+            sorted([Money(3, 'USD'), Money(-1, 'USD'), Money(2, 'USD')]),
+            [Money(-1, 'USD'), Money(2, 'USD'), Money(3, 'USD')])
+        self.assertEqual(
+            len(set([Money('1.5', 'USD'), Money('1.50', 'USD'), Money('1.5', 'EUR')])),
+            2)
+        for other in (0, Decimal('1'), None):
+            for operation in (operator.lt, operator.le, operator.gt, operator.ge):
+                with self.assertRaises(TypeError):
+                    operation(Money(1, 'USD'), other)
+                with self.assertRaises(TypeError):
+                    operation(other, Money(1, 'USD'))
+        self.assertEqual(-Money(2, 'USD'), Money(-2, 'USD'))
+        self.assertEqual(abs(Money(-2, 'USD')), Money(2, 'USD'))
+
+    def test_sum(self):
+        moneys = [Money('0.00001', 'USD')] * 10 + [Money(1, 'USD')]
+        self.assertEqual(sum(moneys), Money('1.0001', 'USD'))
+        self.assertEqual(Money.sum(moneys), Money('1.0001', 'USD'))
+        self.assertEqual(Money.sum([], currency='EUR'), Money(0, 'EUR'))
+        with self.assertRaises(TypeError):
+            5 + Money(1, 'USD')
+        with self.assertRaises(TypeError):
+            Money(1, 'USD') - 5
+        with self.assertRaises(TypeError):
+            sum([Money(1, 'USD')], 5)
+        with self.assertRaises(ValueError):
+            Money.sum([])
+        with self.assertRaises(ValueError):
+            Money.sum([Money(1, 'USD'), Money(1, 'EUR')])
+        total = Money.sum([Money(2, 'USD', exact=True) / 3] * 3)
+        self.assertTrue(total.exact)
+        self.assertEqual(total.rounded(), Money(2, 'USD'))
+
+    def test_money_bag(self):
+        bag = MoneyBag([Money(10, 'USD'), Money(5, 'EUR')])
+        bag += Money(3, 'EUR')
+        bag += MoneyBag([Money(1, 'USD')])
+        self.assertEqual(len(bag), 2)
+        self.assertEqual(bag['EUR'], Money(8, 'EUR'))
+        self.assertEqual(list(bag), [Money(8, 'EUR'), Money(11, 'USD')])
+        # single EUR->USD rate resolution
+        with self.assertNumQueries(6):
+            self.assertEqual(bag.convert_to('USD'), Money('21.4', 'USD'))
+        self.assertEqual(bag.convert_to('EUR'), Money('16.46154', 'EUR'))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Performance contract for the money path: number of database queries and
+cache operations for each rate resolution path plus latency budgets for
+`Money` arithmetic.
+
+Latency budgets are measured on a reference environment. Slower machines
+(CI, debug builds) can scale them with CURRENCY_LATENCY_BUDGET_SCALE
+environment variable, e.g. CURRENCY_LATENCY_BUDGET_SCALE=3.
+
+"""
+
+# system:
+from decimal import Decimal
+import os
+import timeit
+
+# django:
+from django.core.cache import cache
+from django.test import TestCase
+
+# thirdparty
+from mock import patch
+
+# local
+from .. import models
+from ..models import ExchangeRate, Money, cached_get_rate
+from .base import RatesTestMixin
+
+
+LATENCY_BUDGET_SCALE = float(os.environ.get('CURRENCY_LATENCY_BUDGET_SCALE', 1))
+
+
+class TestRateQueryBudget(RatesTestMixin, TestCase):
+
+    def test_direct_rate(self):
+        with self.assertNumQueries(3):
+            rate, is_reverse = self.usd.get_rate_object(self.uah)
+        self.assertFalse(is_reverse)
+
+    def test_reverse_rate(self):
+        with self.assertNumQueries(3):
+            rate, is_reverse = self.usd.get_rate_object(self.eur)
+        self.assertTrue(is_reverse)
+
+    def test_indirect_rate(self):
+        # first lookup computes and stores indirect rate
+        with self.assertNumQueries(6):
+            self.uah.get_rate_object(self.rub)
+        # stored indirect rate is found as direct one afterwards
+        with self.assertNumQueries(5):
+            self.uah.get_rate_object(self.rub)
+
+    def test_cold_cached_get_rate(self):
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+                # 2 currency lookups + direct rate resolution
+                with self.assertNumQueries(5):
+                    cached_get_rate('USD', 'UAH')
+                self.assertEqual(cache_get.call_count, 1)
+                self.assertEqual(cache_set.call_count, 1)
+
+    def test_warm_cached_get_rate(self):
+        cached_get_rate('USD', 'UAH')
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            with patch.object(cache, 'set', wraps=cache.set) as cache_set:
+                with self.assertNumQueries(0):
+                    rate = cached_get_rate('USD', 'UAH')
+                self.assertEqual(rate, Decimal('0.125'))
+                self.assertEqual(cache_get.call_count, 1)
+                self.assertEqual(cache_set.call_count, 0)
+
+    def test_money_convert_to(self):
+        money = Money(100, 'USD')
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            with self.assertNumQueries(5):
+                money.convert_to('UAH')
+            # memoized on instance: neither cache nor database is hit
+            with self.assertNumQueries(0):
+                money.convert_to('UAH')
+            self.assertEqual(cache_get.call_count, 1)
+
+    def test_exchangerate_save(self):
+        rate = ExchangeRate(
+            base_currency=self.eur, foreign_currency=self.uah, rate='10')
+        with patch.object(cache, 'delete', wraps=cache.delete) as cache_delete:
+            with self.assertNumQueries(1):
+                rate.save()
+            # cached rates are dropped in both directions
+            self.assertEqual(cache_delete.call_count, 2)
+
+        rate = (
+            ExchangeRate.objects
+            .select_related('base_currency', 'foreign_currency')
+            .get(pk=rate.pk)
+        )
+        rate.rate = '11'
+        with self.assertNumQueries(1):
+            rate.save()
+
+
+class TestAuditModeQueryBudget(RatesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestAuditModeQueryBudget, self).setUp()
+        patcher = patch.object(
+            models, 'CONFLICT_MODE', models.AUDIT_CONFLICT_MODE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_direct_rate(self):
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            with self.assertNumQueries(1):
+                self.usd.get_rate_object(self.uah)
+            # audited conflicts
+            self.assertEqual(cache_get.call_count, 1)
+
+    def test_reverse_rate(self):
+        with self.assertNumQueries(2):
+            self.usd.get_rate_object(self.eur)
+
+    def test_indirect_rate(self):
+        with self.assertNumQueries(6):
+            self.uah.get_rate_object(self.rub)
+        with self.assertNumQueries(1):
+            self.uah.get_rate_object(self.rub)
+
+
+class TestMoneyLatencyBudget(TestCase):
+
+    number = 2000
+
+    def assertWithinBudget(self, statement, budget, setup='pass'):
+        """
+        Assert that single run of `statement` takes less than `budget`
+        microseconds (best of three series of self.number runs).
+
+        """
+        timer = timeit.Timer(
+            statement, setup='from currency.models import Money\n' + setup)
+        best = min(timer.repeat(repeat=3, number=self.number))
+        per_call = best / self.number * 10 ** 6
+        budget = budget * LATENCY_BUDGET_SCALE
+        self.assertLess(
+            per_call, budget,
+            '%r took %.1fus per call, budget is %.1fus' % (
+                statement, per_call, budget))
+
+    def test_construction(self):
+        self.assertWithinBudget("Money('1531.25', 'USD')", 150)
+
+    def test_addition(self):
+        self.assertWithinBudget(
+            'a + b', 250, "a = Money(1531, 'USD'); b = Money(23, 'USD')")
+
+    def test_subtraction(self):
+        self.assertWithinBudget(
+            'a - b', 250, "a = Money(1531, 'USD'); b = Money(23, 'USD')")
+
+    def test_multiplication(self):
+        self.assertWithinBudget('a * 3', 250, "a = Money(1531, 'USD')")
+
+    def test_division(self):
+        self.assertWithinBudget('a / 3', 300, "a = Money(1531, 'USD')")
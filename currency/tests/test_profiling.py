@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# system:
+import threading
+
+# django:
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+# thirdparty
+from mock import patch
+
+# local
+from .. import profiling
+from ..models import Money
+from ..profiling import ConversionProfiler, ConversionProfilerMiddleware
+from .base import CurrenciesTestMixin
+
+
+class TestConversionProfiler(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestConversionProfiler, self).setUp()
+        self.create_rate(self.usd, self.eur, '0.5')
+
+    def convert(self, number):
+        for value in range(number):
+            Money(value, 'USD').convert_to('EUR')
+
+    def test_counts(self):
+        with ConversionProfiler() as profiler:
+            self.convert(3)
+        self.assertEqual(profiling.profilers, [])
+        Money(1, 'USD').convert_to('EUR')  # not counted
+        stats = profiler.stats()
+        location, pair, counts = stats[0]
+        self.assertIn('test_profiling.py:', location)
+        self.assertEqual(pair, 'USD-EUR')
+        self.assertEqual(counts, {
+            'money': 0, 'convert_to': 3, 'cached_get_rate': 3,
+            'cache_miss': 1, 'get_rate_object': 1})
+        # Money instances: 3 created here and 3 results of convert_to
+        self.assertEqual(
+            sorted((row[1], row[2]['money']) for row in stats[1:]),
+            [('EUR', 3), ('USD', 3)])
+        report = profiler.report()
+        self.assertIn('USD-EUR', report.splitlines()[1])
+
+    def test_template(self):
+        template = Template(
+            '{% load currency %}{% for price in prices %}'
+            '{{ price|convert:"EUR" }}{% money price "EUR" %}{% endfor %}')
+        with ConversionProfiler() as profiler:
+            template.render(Context({'prices': [Money(1, 'USD')] * 2}))
+        location, pair, counts = profiler.stats()[0]
+        # conversions are attributed to render() call
+        self.assertIn('test_profiling.py:', location)
+        self.assertEqual(pair, 'USD-EUR')
+        self.assertEqual(counts['convert_to'], 4)
+
+    def test_threads(self):
+        with ConversionProfiler() as profiler:
+            thread = threading.Thread(target=Money, args=(1, 'USD'))
+            thread.start()
+            thread.join()
+        self.assertFalse(profiler.counts)
+        with ConversionProfiler(all_threads=True) as profiler:
+            thread = threading.Thread(target=Money, args=(1, 'USD'))
+            thread.start()
+            thread.join()
+        self.assertEqual(len(profiler.counts), 1)
+
+    def test_middleware(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ConversionProfilerMiddleware()
+        with override_settings(CURRENCY_PROFILING=True):
+            middleware = ConversionProfilerMiddleware()
+        request = RequestFactory().get('/prices/')
+        middleware.process_request(request)
+        self.convert(2)
+        with patch.object(profiling.logger, 'info') as info:
+            middleware.process_response(request, HttpResponse())
+        self.assertEqual(info.call_count, 1)
+        self.assertEqual(info.call_args[0][1], '/prices/')
+        self.assertEqual(profiling.profilers, [])
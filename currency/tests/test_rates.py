@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# system:
+from decimal import Decimal
+
+# django:
+from django.test import TestCase
+
+# local
+from ..models import Currency, Money
+from ..rates import LatestRates, RateCalendar
+from .base import CurrenciesTestMixin, day
+
+
+class TestRateCalendar(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestRateCalendar, self).setUp()
+        self.create_rate(self.usd, self.eur, '0.8', day(3))
+        self.create_rate(self.usd, self.eur, '0.6', day(7))
+        self.create_rate(self.uah, self.usd, '0.125', day(1))
+        self.create_rate(self.usd, self.uah, '8', day(2))
+        self.create_rate(self.usd, self.rub, '32', day(2))
+
+    def test_forward_fill(self):
+        with self.assertNumQueries(1):
+            calendar = RateCalendar([('USD', 'EUR')], day(1), day(10))
+        with self.assertRaises(Currency.DoesNotExist):
+            calendar.get_rate('USD', 'EUR', on=day(2))
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(3)), Decimal('0.8'))
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(6)), Decimal('0.8'))
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(9)), Decimal('0.6'))
+        self.assertEqual(calendar.get_rate('USD', 'EUR'), Decimal('0.6'))
+        with self.assertRaises(ValueError):
+            calendar.get_rate('USD', 'EUR', on=day(11))
+        with self.assertRaises(KeyError):
+            calendar.get_rate('USD', 'RUB', on=day(5))
+
+    def test_history_before_start(self):
+        self.create_rate(self.usd, self.eur, '0.9', day(1))
+        calendar = RateCalendar([('USD', 'EUR')], day(5), day(10))
+        # only last rate before calendar start is fetched
+        self.assertEqual(
+            calendar.fetch_rates()[('USD', 'EUR')],
+            [(day(3), Decimal('0.8')), (day(7), Decimal('0.6'))])
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(5)), Decimal('0.8'))
+        calendar = RateCalendar([('USD', 'EUR')], day(3), day(4))
+        self.assertEqual(
+            calendar.fetch_rates()[('USD', 'EUR')], [(day(3), Decimal('0.8'))])
+
+    def test_linear(self):
+        calendar = RateCalendar(
+            [('USD', 'EUR')], day(1), day(10), method=RateCalendar.LINEAR)
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(3)), Decimal('0.8'))
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(5)), Decimal('0.7'))
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(9)), Decimal('0.6'))
+
+    def test_reverse_and_indirect(self):
+        calendar = RateCalendar(
+            [(self.eur, self.usd), ('UAH', 'RUB'), ('RUB', 'UAH')],
+            day(1), day(10))
+        self.assertEqual(calendar.get_rate('EUR', 'USD', on=day(4)), Decimal('1.25'))
+        # pair is resolved through calendar of opposite direction
+        self.assertEqual(calendar.get_rate('USD', 'EUR', on=day(4)), Decimal('0.8'))
+        self.assertEqual(calendar.get_rate('UAH', 'RUB', on=day(5)), Decimal('0.25'))
+        self.assertEqual(calendar.get_rate('RUB', 'UAH', on=day(5)), Decimal('4'))
+
+    def test_conflict(self):
+        self.create_rate(self.uah, self.rub, '5', day(1))
+        calendar = RateCalendar([('UAH', 'RUB')], day(1), day(10))
+        self.assertEqual(calendar.get_rate('UAH', 'RUB', on=day(1)), Decimal('5'))
+        # direct rate is older than indirect one
+        with self.assertRaises(ValueError):
+            calendar.get_rate('UAH', 'RUB', on=day(2))
+        calendar = RateCalendar(
+            [('UAH', 'RUB')], day(1), day(10), ignore_conflict=True)
+        self.assertEqual(calendar.get_rate('UAH', 'RUB', on=day(2)), Decimal('0.25'))
+
+    def test_same_as_get_rate(self):
+        calendar = RateCalendar(
+            [('UAH', 'RUB'), ('USD', 'EUR')], day(1), day(10))
+        for pair, on in ((('USD', 'EUR'), day(4)), (('UAH', 'RUB'), day(10))):
+            base, foreign = [Currency.objects.get(code=code) for code in pair]
+            self.assertEqual(
+                calendar.get_rate(base, foreign, on=on),
+                base.get_rate(foreign, on=on))
+
+    def test_dated_lookup_is_not_stored(self):
+        self.create_rate(self.usd, self.rub, '64', day(5))
+        self.assertEqual(
+            Money(1, 'UAH').convert_to('RUB', on=day(3)).value, Decimal('0.25'))
+        self.assertFalse(self.uah.rates.filter(foreign_currency=self.rub).exists())
+        # latest rates don't conflict with rate of the past
+        self.assertEqual(self.uah.get_rate(self.rub), Decimal('0.125'))
+
+    def test_conversion(self):
+        calendar = RateCalendar([('USD', 'EUR')], day(1), day(10))
+        money = Money(10, 'USD')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                money.convert_to('EUR', on=day(4), rates=calendar).value,
+                Decimal('8'))
+            converted = calendar.convert_many(
+                [(money, day(4)), (money, day(8))], 'EUR')
+        self.assertEqual([m.value for m in converted], [Decimal('8'), Decimal('6')])
+        self.assertEqual(money.convert_to('EUR', on=day(4)).value, Decimal('8'))
+        self.assertEqual(money.convert_to('EUR').value, Decimal('6'))
+
+
+class TestLatestRates(CurrenciesTestMixin, TestCase):
+
+    def test_load(self):
+        for number, rate in ((1, '0.9'), (3, '0.8'), (7, '0.6')):
+            self.create_rate(self.usd, self.eur, rate, day(number))
+        self.create_rate(self.uah, self.usd, '0.125', day(2))
+        with self.assertNumQueries(1):
+            latest = LatestRates.load()
+        # only latest row of each pair is fetched
+        self.assertEqual(latest.rates, {
+            ('USD', 'EUR'): (Decimal('0.6'), day(7)),
+            ('UAH', 'USD'): (Decimal('0.125'), day(2)),
+        })
+        self.assertEqual(latest.get_rate('USD', 'UAH'), Decimal('8'))
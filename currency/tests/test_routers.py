@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# system:
+import time
+
+# django:
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+# thirdparty
+from mock import patch
+
+# local
+from .. import routers
+from ..models import Currency, ExchangeRate
+from ..routers import CurrencyRouter
+
+
+class TestCurrencyRouter(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = CurrencyRouter()
+        patchers = [
+            patch.object(routers, 'READ_DATABASE', 'replica'),
+            patch.object(routers, 'WRITE_DATABASE', 'primary'),
+            patch.object(routers, '_last_write', 0),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_routing(self):
+        for model in (Currency, ExchangeRate):
+            self.assertEqual(self.router.db_for_read(model), 'replica')
+            self.assertEqual(self.router.db_for_write(model), 'primary')
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_write(User))
+
+    def test_read_your_writes(self):
+        usd = Currency.get_default_currency()
+        self.assertEqual(self.router.db_for_read(ExchangeRate), 'primary')
+        with patch.object(routers.time, 'time', return_value=routers._last_write + 60):
+            self.assertEqual(self.router.db_for_read(ExchangeRate), 'replica')
+        routers._last_write = 0
+        usd.delete()
+        self.assertEqual(self.router.db_for_read(Currency), 'primary')
+
+    def test_write_of_other_process(self):
+        Currency.objects.create(code='EUR')
+        # window is shared through cache
+        routers._last_write = 0
+        self.assertEqual(self.router.db_for_read(ExchangeRate), 'primary')
+        with patch.object(routers.time, 'time', return_value=time.time() + 60):
+            self.assertEqual(self.router.db_for_read(ExchangeRate), 'replica')
+        cache.clear()
+        self.assertEqual(self.router.db_for_read(ExchangeRate), 'replica')
+
+    def test_allow_relation(self):
+        usd = Currency(code='USD')
+        rate = ExchangeRate(base_currency=usd, foreign_currency=usd)
+        self.assertTrue(self.router.allow_relation(rate, usd))
+        self.assertIsNone(self.router.allow_relation(rate, User()))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# system:
+from decimal import Decimal
+import os
+import shutil
+import tempfile
+import time
+
+# django:
+from django.core.management import call_command
+from django.test import TestCase
+
+# thirdparty
+from mock import patch
+
+# local
+from .. import rates
+from ..models import Currency, ExchangeRate, get_rates_version
+from ..rates import LatestRates, get_latest_rates
+from ..snapshot import dump_rate_snapshot, load_rate_snapshot
+from .base import CurrenciesTestMixin, day
+
+
+class TestRateSnapshot(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestRateSnapshot, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'rates.snapshot')
+        self.create_rate(self.usd, self.eur, '0.8', day(3))
+        self.create_rate(self.usd, self.eur, '0.76923', day(7))
+        self.create_rate(self.usd, self.uah, '8', day(2))
+        self.create_rate(self.usd, self.rub, '32', day(2))
+        self.create_rate(self.eur, self.rub, '40.12345', day(5))
+
+    def tearDown(self):
+        super(TestRateSnapshot, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_latest_rates(self):
+        self.assertEqual(dump_rate_snapshot(self.path), get_rates_version())
+        with self.assertNumQueries(0):
+            mapped = load_rate_snapshot(self.path)
+        latest = LatestRates.load()
+        self.assertEqual(mapped.version, get_rates_version())
+        self.assertEqual(mapped.rates, latest.rates)
+        codes = ['USD', 'EUR', 'UAH', 'RUB', 'GBP']
+        for base in codes:
+            for foreign in codes:
+                try:
+                    expected = latest.get_rate(base, foreign)
+                except (Currency.DoesNotExist, ValueError) as e:
+                    with self.assertRaises(type(e)):
+                        mapped.get_rate(base, foreign)
+                else:
+                    self.assertEqual(mapped.get_rate(base, foreign), expected)
+        with self.assertRaises(ValueError):
+            mapped.get_rate('USD', 'EUR', on=day(5))
+
+    def test_history(self):
+        call_command('dump_rate_snapshot', self.path, history=True)
+        mapped = load_rate_snapshot(self.path)
+        self.assertEqual(mapped.get_rate('USD', 'EUR', on=day(6)), Decimal('0.8'))
+        self.assertEqual(mapped.get_rate('USD', 'EUR', on=day(7)), Decimal('0.76923'))
+        self.assertEqual(mapped.get_rate('EUR', 'USD', on=day(4)), Decimal('1.25'))
+        self.assertEqual(mapped.get_rate('UAH', 'RUB', on=day(4)), Decimal('0.25'))
+        with self.assertRaises(Currency.DoesNotExist):
+            mapped.get_rate('USD', 'EUR', on=day(2))
+        # direct EUR->RUB rate is older than indirect one
+        with self.assertRaises(ValueError):
+            mapped.get_rate('EUR', 'RUB', on=day(7))
+
+    def test_get_latest_rates(self):
+        dump_rate_snapshot(self.path)
+        with patch.object(rates, 'SNAPSHOT_PATH', self.path):
+            with patch.object(rates, '_latest_rates', None):
+                with self.assertNumQueries(0):
+                    latest = get_latest_rates()
+                self.assertEqual(latest.get_rate('USD', 'UAH'), Decimal('8'))
+                # outdated snapshot is not used
+                ExchangeRate.objects.filter(rate='8').get().save()
+                with self.assertNumQueries(1):
+                    get_latest_rates()
+
+    def test_version_does_not_expire(self):
+        version = dump_rate_snapshot(self.path)
+        with patch('time.time', return_value=time.time() + 2 * 86400):
+            self.assertEqual(get_rates_version(), version)
+            self.assertEqual(load_rate_snapshot(self.path).version, version)
+
+    def test_broken_snapshot(self):
+        dump_rate_snapshot(self.path)
+        with open(self.path, 'r+b') as snapshot:
+            snapshot.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ValueError):
+            load_rate_snapshot(self.path)
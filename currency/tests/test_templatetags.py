@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# django:
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+# thirdparty
+from mock import patch
+
+# local
+from ..middleware import RateSnapshotMiddleware
+from ..models import Money
+from ..rates import get_active_snapshot
+from .base import CurrenciesTestMixin
+
+
+class TestTemplateTags(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestTemplateTags, self).setUp()
+        self.eur.money_format = '%(value)s%(short_name)s'
+        self.eur.save()
+        self.create_rate(self.usd, self.eur, '0.5')
+        self.prices = [Money(value, 'USD') for value in range(1, 101)]
+
+    def render(self, template, **context):
+        return Template('{% load currency %}' + template).render(Context(context))
+
+    def test_filters(self):
+        self.assertEqual(
+            self.render('{{ price|convert:"EUR"|money_format }}',
+                        price=Money(3, 'USD')),
+            u'1.50000€')
+        self.assertEqual(
+            self.render('{{ price|money_format }}', price=Money(3, 'USD')),
+            u'$3.00000')
+        self.assertEqual(
+            self.render('{{ price|convert:"UAH" }}', price=Money(3, 'USD')), u'')
+        self.assertEqual(self.render('{{ price|money_format }}', price=3), u'3')
+
+    def test_tag_shares_rates_during_rendering(self):
+        template = '{% for price in prices %}{% money price "EUR" %} {% endfor %}'
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            # EUR currency + USD->EUR rate resolution
+            with self.assertNumQueries(6):
+                result = self.render(template, prices=self.prices)
+            self.assertEqual(cache_get.call_count, 1)
+        self.assertEqual(result.split()[:2], [u'0.50000€', u'1.00000€'])
+
+    def test_tag_without_money(self):
+        self.assertEqual(self.render('{% money missing "EUR" %}'), u'')
+        self.assertEqual(self.render('{% money price %}', price=3), u'')
+
+    def test_middleware(self):
+        middleware = RateSnapshotMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        self.assertIs(get_active_snapshot(), request.currency_rates)
+        template = (
+            '{% for price in prices %}'
+            '{{ price|convert:"EUR"|money_format }}{{ price|money_format }}'
+            '{% endfor %}')
+        with patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            # USD, EUR currencies + USD->EUR rate resolution
+            with self.assertNumQueries(7):
+                self.render(template, prices=self.prices)
+                self.render(template, prices=self.prices)
+            self.assertEqual(cache_get.call_count, 1)
+        response = middleware.process_response(request, HttpResponse())
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_active_snapshot())
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# system:
+import datetime
+import json
+
+# django:
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+# local
+from ..models import Currency, ExchangeRate
+from .base import CurrenciesTestMixin
+
+
+class TestRatesApi(CurrenciesTestMixin, TestCase):
+
+    def setUp(self):
+        super(TestRatesApi, self).setUp()
+        self.yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.create_rate(self.usd, self.eur, '0.5', self.yesterday)
+        self.create_rate(self.usd, self.eur, '0.8')
+        self.create_rate(self.uah, self.usd, '0.125')
+
+    def get(self, url, data=None, status=200, **extra):
+        response = self.client.get(url, data or {}, **extra)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_latest_rates(self):
+        response = self.get(reverse('currency_latest_rates'))
+        self.assertIn('max-age=', response['Cache-Control'])
+        data = json.loads(response.content)
+        today = datetime.date.today().isoformat()
+        self.assertEqual(data['rates'], {
+            'USD': {'EUR': ['0.8', today]},
+            'UAH': {'USD': ['0.125', today]},
+        })
+
+    def test_conditional_get(self):
+        url = reverse('currency_latest_rates')
+        response = self.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag, status=304)
+            self.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+                status=304)
+        ExchangeRate.objects.filter(rate='0.8').get().save()
+        response = self.get(url)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        ExchangeRate.objects.filter(rate='0.125').delete()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotIn('UAH', json.loads(response.content)['rates'])
+
+    def test_pair_rate(self):
+        url = reverse('currency_pair_rate', args=['usd', 'EUR'])
+        self.get(url)
+        with self.assertNumQueries(0):
+            response = self.get(url)
+        self.assertEqual(json.loads(response.content), {
+            'base': 'USD', 'foreign': 'EUR', 'rate': '0.8', 'date': None})
+        response = self.get(
+            reverse('currency_pair_rate', args=['EUR', 'USD']),
+            {'date': self.yesterday.isoformat()})
+        self.assertEqual(json.loads(response.content)['rate'], '2')
+        self.get(reverse('currency_pair_rate', args=['EUR', 'RUB']), status=404)
+        self.get(url, {'date': 'yesterday'}, status=400)
+
+    def test_dated_rate_is_read_only(self):
+        self.create_rate(self.usd, self.uah, '8', self.yesterday)
+        url = reverse('currency_pair_rate', args=['EUR', 'UAH'])
+        etag = self.get(url)['ETag']
+        count = ExchangeRate.objects.count()
+        with self.assertNumQueries(1):
+            response = self.get(url, {'date': datetime.date.today().isoformat()})
+        # indirect rate is not stored
+        self.assertEqual(json.loads(response.content)['rate'], '0.1')
+        self.assertEqual(ExchangeRate.objects.count(), count)
+        self.assertEqual(response['ETag'], etag)
+        self.get(url, HTTP_IF_NONE_MATCH=etag, status=304)
+
+    def test_bulk_rates(self):
+        response = self.get(
+            reverse('currency_bulk_rates'), {'pairs': 'USD-EUR,EUR-USD,USD-RUB'})
+        self.assertEqual(json.loads(response.content), {
+            'date': None,
+            'rates': {'USD-EUR': '0.8', 'EUR-USD': '1.25', 'USD-RUB': None},
+        })
+        self.get(reverse('currency_bulk_rates'), {'pairs': 'USD'}, status=400)
+
+    def test_rate_format(self):
+        gbp = Currency.objects.create(code='GBP', short_name=u'£')
+        self.create_rate(self.usd, gbp, '0.1')
+        response = self.get(
+            reverse('currency_bulk_rates'), {'pairs': 'GBP-USD,USD-GBP'})
+        self.assertEqual(
+            json.loads(response.content)['rates'],
+            {'GBP-USD': '10', 'USD-GBP': '0.1'})
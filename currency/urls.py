@@ -0,0 +1,9 @@
+from django.conf.urls import patterns, url
+
+
+urlpatterns = patterns('currency.views',
+    url(r'^$', 'latest_rates', name='currency_latest_rates'),
+    url(r'^bulk/$', 'bulk_rates', name='currency_bulk_rates'),
+    url(r'^(?P<base>[A-Za-z]{3})/(?P<foreign>[A-Za-z]{3})/$', 'pair_rate',
+        name='currency_pair_rate'),
+)
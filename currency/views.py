@@ -1 +1,142 @@
-# Create your views here.
+# -*- coding: utf-8 -*-
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .models import Currency, get_rates_version
+from .rates import RateCalendar, get_latest_rates
+
+
+# seconds clients may use rates without revalidation
+API_MAX_AGE = getattr(settings, 'CURRENCY_API_MAX_AGE', 60)
+
+
+def rates_etag(request, *args, **kwargs):
+    return str(get_rates_version())
+
+
+def rates_last_modified(request, *args, **kwargs):
+    return get_latest_rates().last_modified
+
+
+def rates_api(view):
+    """
+    Decorate read-only rates view with conditional GET support based on
+    rates version and Cache-Control headers
+
+    """
+    view = condition(etag_func=rates_etag, last_modified_func=rates_last_modified)(view)
+    view = cache_control(public=True, max_age=API_MAX_AGE)(view)
+    return require_GET(view)
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        json.dumps(data, separators=(',', ':'), sort_keys=True),
+        content_type='application/json', status=status)
+
+
+def get_rates_source(request, pairs):
+    """
+    Return rates lookup object for (base, foreign) `pairs` and date from
+    `date` GET parameter. Latest rates are served from memory, rates for
+    dates are fetched with single query and are never saved so that reads
+    do not change rates version.
+
+    """
+    date = request.GET.get('date')
+    if not date:
+        return get_latest_rates(), None
+    try:
+        date = parse_date(date)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValueError('date should be in YYYY-MM-DD format')
+    return RateCalendar(pairs, date, date), date
+
+
+def compact(rate):
+    """
+    Return string of Decimal `rate` without trailing zeros
+    """
+    rate = '{0:f}'.format(rate)
+    if '.' in rate:
+        rate = rate.rstrip('0').rstrip('.')
+    return rate
+
+
+def format_rate(rates, base, foreign, date):
+    try:
+        return compact(rates.get_rate(base, foreign, on=date))
+    except (Currency.DoesNotExist, ValueError):
+        return None
+
+
+@rates_api
+def latest_rates(request):
+    """
+    All latest stored rates:
+    {"rates": {"USD": {"EUR": ["0.76923", "2013-06-13"]}}, "version": 1371081600000}
+
+    """
+    latest = get_latest_rates()
+    matrix = {}
+    for (base, foreign), (rate, date) in latest.rates.items():
+        matrix.setdefault(base, {})[foreign] = [compact(rate), date.isoformat()]
+    return json_response({'rates': matrix, 'version': latest.version})
+
+
+@rates_api
+def pair_rate(request, base, foreign):
+    """
+    Rate to convert `base` to `foreign` (optionally for `date`):
+    {"base": "USD", "date": null, "foreign": "EUR", "rate": "0.76923"}
+
+    """
+    base, foreign = base.upper(), foreign.upper()
+    try:
+        rates, date = get_rates_source(request, [(base, foreign)])
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+    try:
+        rate = rates.get_rate(base, foreign, on=date)
+    except Currency.DoesNotExist:
+        return json_response({'error': 'rate not found'}, status=404)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=409)
+    return json_response({
+        'base': base, 'foreign': foreign, 'rate': compact(rate),
+        'date': date and date.isoformat(),
+    })
+
+
+@rates_api
+def bulk_rates(request):
+    """
+    Rates for list of pairs (optionally for `date`) that are null if rate
+    can't be found: ?pairs=USD-EUR,EUR-UAH
+    {"date": null, "rates": {"EUR-UAH": null, "USD-EUR": "0.76923"}}
+
+    """
+    try:
+        pairs = [
+            pair.upper().split('-')
+            for pair in request.GET.get('pairs', '').split(',') if pair
+        ]
+        if any(len(pair) != 2 for pair in pairs):
+            raise ValueError('pairs should be comma-separated BASE-FOREIGN codes')
+        rates, date = get_rates_source(request, pairs)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=400)
+    return json_response({
+        'rates': dict(
+            ('%s-%s' % (base, foreign), format_rate(rates, base, foreign, date))
+            for base, foreign in pairs
+        ),
+        'date': date and date.isoformat(),
+    })
@@ -17,6 +17,9 @@ setup(
     url='https://github.com/42cc/django-currency',
     packages=find_packages(exclude=['test_project']),
     install_requires=[],
+    extras_require={
+        'matrix': ['numpy'],
+    },
     include_package_data=True,
     zip_safe=False,
 )